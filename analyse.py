@@ -4,13 +4,18 @@
 This script was used for all analysis.
 """
 
+import hashlib
+import inspect
 import json
-import pandas
+import os
 import scipy.stats
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from matplotlib.lines import Line2D
-import objects
 import pandas as pd
 import seaborn as sns
+import fileutil
+import stagecache
+import subjectstream
 import numpy as np
 import matplotlib.patches as mpatches
 import matplotlib.pyplot as plt
@@ -18,37 +23,28 @@ from scipy.stats import pearsonr
 
 
 def load_test_subjects(base_loc: str = ".\\results\\",
-                       filename: str = "adaptive_ExperimentOneAdaptiveSubjectData.json"):
+                       filename: str = "adaptive_ExperimentOneAdaptiveSubjectData.json", actions: bool = False):
     """
     Loads the patient dictionary from .\\results\\ExperimentOneSubjectData.json.
+    Subjects are streamed one at a time through a sidecar index (see subjectstream.py), the whole file is never
+    in memory.
     :param filename: As variable name implies, exact filename
     :param base_loc: Base diractory or path_to_file
+    :param actions: Load the per-frame actions as well, otherwise only the 'pre-start' data of every video is kept.
     :return: Returns dictionary, example: {0: first name-last name-subject_id}
     """
-    dictionary = {}
+    list_of_subject_objects = {}
     try:
-        with open(base_loc + filename, 'r') as file:
-            dictionary = json.load(file)
-            file.close()
+        for subject_index, subject in subjectstream.iter_subjects(base_loc + filename, actions):
+            # If the number of answers are unqual to the amount of videos, active_subject is unfinished
+            if len(subject.get_answers()) == 16:
+                list_of_subject_objects[subject_index] = subject
     except json.decoder.JSONDecodeError:
         pass
     except FileNotFoundError:
         print(f"Error: check the existence of {base_loc + filename}")
         quit()
 
-    list_of_subject_objects = {}
-    for data in dictionary.items():
-        subject_index = data[0]
-        info = data[1]
-        if len(info['answers']) == 16:
-            list_of_subject_objects[subject_index] = objects.Subject(
-                subject_id=info['subject_id'],
-                order=info['order'],
-                answers=info['answers'],
-                actions=info['actions']
-            )
-
-        # If the number of answers are unqual to the amount of videos, active_subject is unfinished
     return list_of_subject_objects
 
 
@@ -72,65 +68,73 @@ def load_json(base_loc: str, filename: str):
     return dictionary
 
 
+def load_answers_df():
+    """
+    Loads the subject data of both conditions and converts it to one big pandas dataframe.
+    :return: pandas dataframe, see get_answers_df
+    """
+    global a_subjects, f_subjects
+    a_subjects = load_test_subjects(base_loc=f"{DATA_DIR}adaptive\\", filename="combined_adaptive.json")
+    f_subjects = load_test_subjects(base_loc=f"{DATA_DIR}fixed\\", filename="combined_fixed.json")
+    return get_answers_df()
+
+
 def get_answers_df():
     """
-    Convert json data to one big pandas dataframe
+    Convert json data to one big pandas dataframe. The answers of all subjects are collected in one pass, correctness,
+    colours and mode labels are then computed for all rows at once by joining with the answer key.
     :return: pandas dataframe
     """
-    subject_id = []
-    trials = []
-    video_name = []
-    mode = []
-    correct_cars = []
-    conf_cars = []
-    correct_people = []
-    conf_people = []
-    vid_rating = []
-    bar_plot_color_ppl = []
-    bar_plot_color_cars = []
-
-    correctness_numeric = {True: 1, False: 0}
-    correctness_color = {True: '#0099d6', False: '#ff2f2f'}
-
-    for subjects in [f_subjects, a_subjects]:
-        for sub_id, subject in subjects.items():
-            trial = 0
-            subject_data = subject.get_object_as_dict()
-            for vid_name, answer_data in subject_data.get('answers').items():
-                if subjects == a_subjects:
-                    mode_type = "Adaptive CED"
-                else:
-                    if subject_data.get('actions').get(vid_name).get('pre-start').get('DVS'):
-                        mode_type = "DVS"
-                    else:
-                        mode_type = "Fixed CED"
-
-                vid_name = vid_name.split("\\")[-1]
-                trial += 1
-                subject_id.append(sub_id)
-                video_name.append(vid_name)
-                trials.append(trial)
-                correct_cars.append(
-                    correctness_numeric.get(answer_data.get('cars') == ANSWERS.get(vid_name).get('cars')))
-                bar_plot_color_cars.append(
-                    correctness_color.get(answer_data.get('cars') == ANSWERS.get(vid_name).get('cars')))
-                correct_people.append(
-                    correctness_numeric.get(answer_data.get('people') == ANSWERS.get(vid_name).get('people'))
-                )
-                bar_plot_color_ppl.append(
-                    correctness_color.get(answer_data.get('people') == ANSWERS.get(vid_name).get('people')))
-                conf_cars.append(answer_data.get('cars_conf'))
-                conf_people.append(answer_data.get('people_conf'))
-                vid_rating.append(answer_data.get('rating'))
-                mode.append(mode_type)
-
-    dataframe = pd.DataFrame(
-        data=dict(subject=subject_id, mode=mode, video=video_name, trial=trials, cars=correct_cars,
-                  confidence_cars=conf_cars, people=correct_people, confidence_people=conf_people,
-                  video_rating=vid_rating, car_col=bar_plot_color_cars, people_col=bar_plot_color_ppl)
-    )
-
-    return dataframe
+    columns = ['subject', 'adaptive', 'dvs', 'video', 'trial', 'answer_cars', 'confidence_cars', 'answer_people',
+               'confidence_people', 'video_rating']
+    rows = [(sub_id, subjects is a_subjects,
+             subjects is f_subjects and bool(subject.get_data()[2][vid_name]['pre-start'].get('DVS')),
+             vid_name, trial, answer_data.get('cars'), answer_data.get('cars_conf'), answer_data.get('people'),
+             answer_data.get('people_conf'), answer_data.get('rating'))
+            for subjects in [f_subjects, a_subjects]
+            for sub_id, subject in subjects.items()
+            for trial, (vid_name, answer_data) in enumerate(subject.get_answers().items(), start=1)]
+    dataframe = pd.DataFrame(rows, columns=columns)
+
+    dataframe['video'] = dataframe['video'].str.split('\\').str[-1]
+    answer_key = pd.DataFrame.from_dict(ANSWERS, orient='index').add_prefix('key_')
+    dataframe = dataframe.join(answer_key, on='video')
+
+    correctness_color = np.array(['#ff2f2f', '#0099d6'])  # indexed by correctness, 0 is incorrect
+    dataframe['cars'] = (dataframe['answer_cars'] == dataframe['key_cars']).astype(int)
+    dataframe['people'] = (dataframe['answer_people'] == dataframe['key_people']).astype(int)
+    dataframe['car_col'] = correctness_color[dataframe['cars'].to_numpy()]
+    dataframe['people_col'] = correctness_color[dataframe['people'].to_numpy()]
+    dataframe['mode'] = np.where(dataframe['adaptive'], "Adaptive CED",
+                                 np.where(dataframe['dvs'], "DVS", "Fixed CED"))
+
+    return dataframe[['subject', 'mode', 'video', 'trial', 'cars', 'confidence_cars', 'people', 'confidence_people',
+                      'video_rating', 'car_col', 'people_col']]
+
+
+def get_trial_accuracy():
+    """
+    Average accuracy per trial of all modes in one groupby. Answers with a confidence equal to / smaller than CUTOFF
+    are masked out, for cars and people separately.
+    :return: pandas dataframe indexed by (mode, trial), accuracy of cars and people in %
+    """
+    masked = pd.DataFrame(dict(
+        cars=subject_answers_df['cars'].where(subject_answers_df['confidence_cars'] > CUTOFF),
+        people=subject_answers_df['people'].where(subject_answers_df['confidence_people'] > CUTOFF)))
+    return masked.groupby([subject_answers_df['mode'], subject_answers_df['trial']]).mean() * 100
+
+
+def finish_figure(path: str = None, show: bool = True):
+    """
+    Saves and/or shows the current figure, then closes it.
+    :param path: File to save the figure to, None doesn't save.
+    :param show: Block on plt.show(), batch rendering passes False.
+    """
+    if path is not None:
+        plt.savefig(path)
+    if show:
+        plt.show()
+    plt.close('all')
 
 
 def learning_curve(mode: str):
@@ -138,46 +142,40 @@ def learning_curve(mode: str):
     Preform r-pearson test
     :param mode: mode name, further defined under main
     """
-    y_axis = {'cars_y': [],
-              'people_y': []}
-
-    for trial in range(1, 17):
-        target_rows = subject_answers_df.loc[
-            (subject_answers_df['mode'] == mode) & (subject_answers_df['trial'] == trial)]
+    curve = trial_accuracy.loc[mode]
+    x_axis = curve.index.tolist()
+    car_corr, pval_c = pearsonr(x_axis, curve['cars'].tolist())
+    people_corr, pval_p = pearsonr(x_axis, curve['people'].tolist())
 
-        temp_cars = []
-        temp_people = []
-        for row_index, row in target_rows.iterrows():
-            if row['confidence_cars'] > CUTOFF:
-                temp_cars.append(row['cars'])
-            if row['confidence_people'] > CUTOFF:
-                temp_people.append(row['people'])
+    print(f"Learning curve correlation cars for {mode}: {car_corr}\n"
+          f"With p-value of: {pval_c}\n"
+          f"Learning curve correlation people for {mode}: {people_corr}\n"
+          f"With p-value of: {pval_p}\n")
+    if not BATCH_PLOTS:
+        plot_learning_curve(mode, curve, CUTOFF)
 
-        y_axis['cars_y'].append(np.average(temp_cars) * 100)
-        y_axis['people_y'].append(np.average(temp_people) * 100)
 
-    x_axis = [x + 1 for x in range(16)]
+def plot_learning_curve(mode: str, curve: pd.DataFrame, cutoff: int, path: str = None, show: bool = True):
+    """
+    Plots the average accuracy per trial of one mode.
+    :param mode: mode name, further defined under main
+    :param curve: Rows of get_trial_accuracy() belonging to this mode
+    :param cutoff: Confidence cut-off the curve was computed with, shown in the title.
+    """
+    x_axis = curve.index.tolist()
 
     plt.figure(figsize=(14, 8))
     plt.ylim(0, 100)
-    plt.plot(x_axis, y_axis['cars_y'], label='Cars', color="BLACK", alpha=1)
-    plt.plot(x_axis, y_axis['people_y'], label='People', color="BLUE", alpha=1)
+    plt.plot(x_axis, curve['cars'].tolist(), label='Cars', color="BLACK", alpha=1)
+    plt.plot(x_axis, curve['people'].tolist(), label='People', color="BLUE", alpha=1)
     plt.xticks(np.arange(1, max(x_axis) + 1, 1), fontsize=24)
     plt.yticks(fontsize=24)
     plt.xlabel('Trial number', fontweight='bold', fontsize=24)
     plt.ylabel('Average accuracy (in %)', fontweight='bold', fontsize=24)
     plt.legend(loc="upper right", fontsize=18)
-    x_axis = [x for x in range(16)]
-    car_corr, pval_c = pearsonr(x_axis, y_axis['cars_y'])
-    people_corr, pval_p = pearsonr(x_axis, y_axis['people_y'])
-    plt.title(f'With confidence cut-off of: {CUTOFF}', fontsize=16)
+    plt.title(f'With confidence cut-off of: {cutoff}', fontsize=16)
     plt.suptitle(f'Average accuracy over time in {mode}', fontsize=20, y=0.95)
-
-    print(f"Learning curve correlation cars for {mode}: {car_corr}\n"
-          f"With p-value of: {pval_c}\n"
-          f"Learning curve correlation people for {mode}: {people_corr}\n"
-          f"With p-value of: {pval_p}\n")
-    plt.show()
+    finish_figure(path, show)
 
 
 
@@ -201,42 +199,31 @@ def test_normality():
         print()
 
 
-def get_average_sub_accuracy():
+def get_subject_averages():
     """
-    Convert individual's answers to correct
-    :return: 4 pandas dataframes
+    Convert individual's answers to correct, averaged per mode and subject in one groupby. Subjects are taken from
+    the data, ordered by mode (as in MODES) and then numerically by subject id.
+    :return: pandas dataframe with the average accuracy and confidence for cars and people per mode and subject
     """
-    c_accuracy = []
-    car_mode = []
-    car_conf = []
-
-    p_accuracy = []
-    people_mode = []
-    people_conf = []
-
-    for mode in MODES:
-        if mode == 'Fixed CED' or mode == 'DVS':
-            loop_range = range(10, 30)
-        else:
-            loop_range = range(10)
-        for subject in loop_range:
-            target_rows = subject_answers_df.loc[
-                (subject_answers_df['mode'] == mode) & (subject_answers_df['subject'] == f'{subject}')]
-            if len(target_rows) != 0:
-                c_accuracy.append(np.average(target_rows['cars'].tolist()))
-                p_accuracy.append(np.average(target_rows['people'].tolist()))
-
-                car_conf.append(np.average(target_rows['confidence_cars'].tolist()))
-                people_conf.append(np.average(target_rows['confidence_people'].tolist()))
+    averages = (subject_answers_df[subject_answers_df['mode'].isin(MODES)]
+                .groupby(['mode', 'subject'], sort=False)[['cars', 'people', 'confidence_cars', 'confidence_people']]
+                .mean().reset_index())
+    averages = averages.sort_values(['mode', 'subject'], kind='stable', key=lambda column: (
+        column.map(MODES.index) if column.name == 'mode' else pd.to_numeric(column, errors='coerce')))
+    return averages.reset_index(drop=True)
 
-                car_mode.append(mode)
-                people_mode.append(mode)
 
-    df_cars_acc = pandas.DataFrame(dict(mode=car_mode, accuracy=c_accuracy))
-    df_car_conf = pandas.DataFrame(dict(mode=people_mode, confidence=car_conf))
+def get_average_sub_accuracy(averages: pd.DataFrame):
+    """
+    Splits the subject averages per object and metric.
+    :param averages: get_subject_averages()
+    :return: 4 pandas dataframes
+    """
+    df_cars_acc = averages[['mode', 'cars']].rename(columns={'cars': 'accuracy'})
+    df_car_conf = averages[['mode', 'confidence_cars']].rename(columns={'confidence_cars': 'confidence'})
 
-    df_people_acc = pandas.DataFrame(dict(mode=people_mode, accuracy=p_accuracy))
-    df_people_conf = pandas.DataFrame(dict(mode=people_mode, confidence=people_conf))
+    df_people_acc = averages[['mode', 'people']].rename(columns={'people': 'accuracy'})
+    df_people_conf = averages[['mode', 'confidence_people']].rename(columns={'confidence_people': 'confidence'})
 
     return df_cars_acc, df_car_conf, df_people_acc, df_people_conf
 
@@ -247,52 +234,94 @@ def individual_scoring(subject_id: str):
     :param subject_id: id of subject, must range within 0-29
     """
     target_rows = subject_answers_df.loc[(subject_answers_df['subject'] == subject_id)]
+    plot_individual(subject_id, target_rows, path=os.path.join(PLOT_DIR, 'individual', f"{subject_id}_bar.png"))
+
 
+def plot_individual(subject_id: str, target_rows: pd.DataFrame, path: str = None, show: bool = True):
+    """
+    Draws the individual's performance plot, see individual_scoring.
+    :param subject_id: id of subject, used in the title.
+    :param target_rows: Rows of subject_answers_df belonging to this subject
+    """
     # set width of bar
     bar_width = 0.25
-    plt.rcParams["figure.figsize"] = [7.50, 3.50]
-    plt.rcParams["figure.autolayout"] = True
-
-    font = {'weight': 'bold',
-            'size': 9}
-
-    plt.rc('font', **font)
-    fig, ax = plt.subplots(figsize=(16, 8))
-    numeric_x_axis = np.arange(len(target_rows['video']))
-
-    def autolabel(rects, label):
-        for idx, rect in enumerate(rects):
-            ax.text(x=rect.get_x() + 0.05, y=0.2, s=label, fontdict={'weight': 'bold', 'size': 9},
-                    multialignment='center'
-                    )
-
-    car_bar = ax.bar(numeric_x_axis + 0.15, target_rows['confidence_cars'], color=target_rows['car_col'],
-                     width=bar_width,
-                     tick_label='cars')
-    people_bar = ax.bar(numeric_x_axis - 0.15, target_rows['confidence_people'],
-                        color=target_rows['people_col'],
-                        width=bar_width,
-                        tick_label='people')
-    autolabel(car_bar, 'C')
-    autolabel(people_bar, 'P')
-    ax.plot(numeric_x_axis, target_rows['video_rating'], color='black', label='video rating')
-    ax.scatter(numeric_x_axis, target_rows['video_rating'], s=100, color='black')
-
-    # Make the plot
-    plt.xlabel('Video name', fontweight='bold', fontsize=15)
-    plt.ylabel('Confidence rating', fontweight='bold', fontsize=15)
-    plt.xticks(numeric_x_axis, target_rows['video'])  # Replace numerics with video names.
-    plt.title(f"Confidence and accuracy in detecting cars & people for subject {subject_id}")
-
-    #  Legend stuff
-    blue_patch = mpatches.Patch(color='#0099d6', label='Correct')
-    red_patch = mpatches.Patch(color='#ff2f2f', label='Incorrect')
-    line = Line2D([0], [0], color='black', label="Video score")
-    p = mpatches.Circle((0, 0), radius=0, facecolor='None', label='P = People')
-    c = mpatches.Circle((0, 0), radius=0, facecolor='None', label='C = Cars')
-    plt.legend(handles=[blue_patch, red_patch, line, p, c], loc='upper right')
-    plt.savefig(f".\\results\\plots\\individual\\{subject_id}_bar.png")
-    plt.show()
+    # Only for this figure, with BATCH_PLOTS the same worker process draws other figures afterwards.
+    with plt.rc_context({'figure.figsize': [7.50, 3.50], 'figure.autolayout': True, 'font.weight': 'bold',
+                         'font.size': 9}):
+        fig, ax = plt.subplots(figsize=(16, 8))
+        numeric_x_axis = np.arange(len(target_rows['video']))
+
+        def autolabel(rects, label):
+            for idx, rect in enumerate(rects):
+                ax.text(x=rect.get_x() + 0.05, y=0.2, s=label, fontdict={'weight': 'bold', 'size': 9},
+                        multialignment='center'
+                        )
+
+        car_bar = ax.bar(numeric_x_axis + 0.15, target_rows['confidence_cars'], color=target_rows['car_col'],
+                         width=bar_width,
+                         tick_label='cars')
+        people_bar = ax.bar(numeric_x_axis - 0.15, target_rows['confidence_people'],
+                            color=target_rows['people_col'],
+                            width=bar_width,
+                            tick_label='people')
+        autolabel(car_bar, 'C')
+        autolabel(people_bar, 'P')
+        ax.plot(numeric_x_axis, target_rows['video_rating'], color='black', label='video rating')
+        ax.scatter(numeric_x_axis, target_rows['video_rating'], s=100, color='black')
+
+        # Make the plot
+        plt.xlabel('Video name', fontweight='bold', fontsize=15)
+        plt.ylabel('Confidence rating', fontweight='bold', fontsize=15)
+        plt.xticks(numeric_x_axis, target_rows['video'])  # Replace numerics with video names.
+        plt.title(f"Confidence and accuracy in detecting cars & people for subject {subject_id}")
+
+        #  Legend stuff
+        blue_patch = mpatches.Patch(color='#0099d6', label='Correct')
+        red_patch = mpatches.Patch(color='#ff2f2f', label='Incorrect')
+        line = Line2D([0], [0], color='black', label="Video score")
+        p = mpatches.Circle((0, 0), radius=0, facecolor='None', label='P = People')
+        c = mpatches.Circle((0, 0), radius=0, facecolor='None', label='C = Cars')
+        plt.legend(handles=[blue_patch, red_patch, line, p, c], loc='upper right')
+        finish_figure(path, show)
+
+
+def comparison_figures(modes: list, title: str):
+    """
+    Arguments of comparison_plot for the accuracy and confidence in identifying cars and people between two modes.
+    :param modes: The two mode names compared
+    :param title: Title of every figure
+    :return: {file name: keyword arguments}, in the order the figures are shown.
+    """
+    figures = {}
+    for frame, value, scale, ylim, suptitle in [
+            (car_accuracy, 'accuracy', 100, (0, 102), 'Percentage correct for identifying cars'),
+            (people_accuracy, 'accuracy', 100, (0, 102), 'Percentage correct for identifying people'),
+            (car_confidence, 'confidence', 1, (1, 5), 'Confidence in identifying cars'),
+            (people_confidence, 'confidence', 1, (1, 5), 'Confidence in identifying people')]:
+        name = f"{'_'.join(modes)}_{value}_{suptitle.split()[-1]}.png".replace(' ', '_').lower()
+        figures[name] = dict(target_rows=frame.loc[frame['mode'].isin(modes)], value=value, scale=scale, ylim=ylim,
+                             title=title, suptitle=suptitle, palette=box_colors)
+    return figures
+
+
+def comparison_plot(target_rows: pd.DataFrame, value: str, scale: float, ylim: tuple, title: str, suptitle: str,
+                    palette: dict, path: str = None, show: bool = True):
+    """
+    Box plot with the individual averages on top, one box per mode.
+    :param target_rows: Rows of one of the get_average_sub_accuracy() dataframes
+    :param value: Column plotted, 'accuracy' or 'confidence'
+    :param scale: Factor the values are multiplied with (100 for accuracy in %)
+    :param palette: Colour per mode
+    """
+    plt.figure()
+    plt.ylim(*ylim)
+    sns.boxplot(x=target_rows['mode'], y=target_rows[value] * scale, data=target_rows, whis=np.inf, palette=palette)
+
+    sns.swarmplot(x=target_rows['mode'], y=target_rows[value] * scale, data=target_rows, color="white",
+                  edgecolor="black", linewidth=.5)
+    plt.title(title, fontsize=12)
+    plt.suptitle(suptitle, fontsize=16, y=0.98)
+    finish_figure(path, show)
 
 
 def fixed_adaptive_comparison():
@@ -300,34 +329,19 @@ def fixed_adaptive_comparison():
     Plots graphs for comparison of people-cars accuracy-confidence between fixed CED and adaptive CED.
     And preform corresponding statistical tests.
     """
+    figures = list(comparison_figures(['Adaptive CED', 'Fixed CED'], 'Fixed CED and Adaptive CED').values())
     avg_cars_adaptive = car_accuracy.loc[(car_accuracy['mode'] == 'Adaptive CED')]['accuracy'].to_list()
     avg_cars_fixed = car_accuracy.loc[(car_accuracy['mode'] == 'Fixed CED')]['accuracy'].to_list()
 
-    target_rows = car_accuracy.loc[car_accuracy['mode'].isin(['Adaptive CED', 'Fixed CED'])]
-    plt.ylim(0, 102)
-    sns.boxplot(x=target_rows['mode'], y=target_rows['accuracy'] * 100, data=target_rows, whis=np.inf,
-                palette=box_colors)
-
-    sns.swarmplot(x=target_rows['mode'], y=target_rows['accuracy'] * 100, data=target_rows, color="white",
-                  edgecolor="black", linewidth=.5)
-    plt.title(f'Fixed CED and Adaptive CED', fontsize=12)
-    plt.suptitle(f'Percentage correct for identifying cars', fontsize=16, y=0.98)
-    plt.show()
+    if not BATCH_PLOTS:
+        comparison_plot(**figures[0])
     car_null_hypothesis = scipy.stats.ttest_ind(avg_cars_adaptive, avg_cars_fixed)
 
     avg_people_adaptive = people_accuracy.loc[(people_accuracy['mode'] == 'Adaptive CED')]['accuracy'].to_list()
     avg_people_fixed = people_accuracy.loc[(people_accuracy['mode'] == 'Fixed CED')]['accuracy'].to_list()
 
-    target_rows = people_accuracy.loc[people_accuracy['mode'].isin(['Adaptive CED', 'Fixed CED'])]
-    plt.ylim(0, 102)
-    sns.boxplot(x=target_rows['mode'], y=target_rows['accuracy'] * 100, data=target_rows, whis=np.inf,
-                palette=box_colors)
-
-    sns.swarmplot(x=target_rows['mode'], y=target_rows['accuracy'] * 100, data=target_rows, color="white",
-                  edgecolor="black", linewidth=.5)
-    plt.title(f'Fixed CED and Adaptive CED', fontsize=12)
-    plt.suptitle(f'Percentage correct for identifying people', fontsize=16, y=0.98)
-    plt.show()
+    if not BATCH_PLOTS:
+        comparison_plot(**figures[1])
 
     people_null_hypothesis = scipy.stats.ttest_ind(avg_people_adaptive, avg_people_fixed)
     print('ACCURACY')
@@ -351,30 +365,16 @@ def fixed_adaptive_comparison():
     avg_cars_adaptive = car_confidence.loc[(car_accuracy['mode'] == 'Adaptive CED')]['confidence'].to_list()
     avg_cars_fixed = car_confidence.loc[(car_accuracy['mode'] == 'Fixed CED')]['confidence'].to_list()
 
-    target_rows = car_confidence.loc[car_confidence['mode'].isin(['Adaptive CED', 'Fixed CED'])]
-    plt.ylim(1, 5)
-    sns.boxplot(x=target_rows['mode'], y=target_rows['confidence'], data=target_rows, whis=np.inf, palette=box_colors)
-
-    sns.swarmplot(x=target_rows['mode'], y=target_rows['confidence'], data=target_rows, color="white",
-                  edgecolor="black", linewidth=.5)
-    plt.title(f'Fixed CED and Adaptive CED', fontsize=12)
-    plt.suptitle(f'Confidence in identifying cars', fontsize=16, y=0.98)
-    plt.show()
+    if not BATCH_PLOTS:
+        comparison_plot(**figures[2])
 
     car_null_hypothesis = scipy.stats.ttest_ind(avg_cars_adaptive, avg_cars_fixed)
 
     avg_people_adaptive = people_confidence.loc[(people_confidence['mode'] == 'Adaptive CED')]['confidence'].to_list()
     avg_people_fixed = people_confidence.loc[(people_confidence['mode'] == 'Fixed CED')]['confidence'].to_list()
 
-    target_rows = people_confidence.loc[people_confidence['mode'].isin(['Adaptive CED', 'Fixed CED'])]
-    plt.ylim(1, 5)
-    sns.boxplot(x=target_rows['mode'], y=target_rows['confidence'], data=target_rows, whis=np.inf, palette=box_colors)
-
-    sns.swarmplot(x=target_rows['mode'], y=target_rows['confidence'], data=target_rows, color="white",
-                  edgecolor="black", linewidth=.5)
-    plt.title(f'Fixed CED and Adaptive CED', fontsize=12)
-    plt.suptitle(f'Confidence in identifying people', fontsize=16, y=0.98)
-    plt.show()
+    if not BATCH_PLOTS:
+        comparison_plot(**figures[3])
 
     people_null_hypothesis = scipy.stats.ttest_ind(avg_people_adaptive, avg_people_fixed)
     print("CONFIDENCE")
@@ -400,19 +400,12 @@ def fixed_dvs_comparison():
     Plots graphs for comparison of people-cars accuracy-confidence between fixed CED and DVS.
     And preform corresponding statistical tests.
     """
+    figures = list(comparison_figures(['DVS', 'Fixed CED'], 'Fixed CED and DVS').values())
     avg_cars_dvs = car_accuracy.loc[(car_accuracy['mode'] == 'DVS')]['accuracy'].to_list()
     avg_cars_fixed = car_accuracy.loc[(car_accuracy['mode'] == 'Fixed CED')]['accuracy'].to_list()
 
-    target_rows = car_accuracy.loc[car_accuracy['mode'].isin(['DVS', 'Fixed CED'])]
-    plt.ylim(0, 102)
-    sns.boxplot(x=target_rows['mode'], y=target_rows['accuracy'] * 100, data=target_rows, whis=np.inf,
-                palette=box_colors)
-
-    sns.swarmplot(x=target_rows['mode'], y=target_rows['accuracy'] * 100, data=target_rows, color="white",
-                  edgecolor="black", linewidth=.5)
-    plt.title(f'Fixed CED and DVS', fontsize=12)
-    plt.suptitle(f'Percentage correct for identifying cars', fontsize=16, y=0.98)
-    plt.show()
+    if not BATCH_PLOTS:
+        comparison_plot(**figures[0])
 
     car_null_hypothesis = scipy.stats.ttest_rel(avg_cars_dvs, avg_cars_fixed, alternative='two-sided')
 
@@ -421,16 +414,8 @@ def fixed_dvs_comparison():
 
     people_null_hypothesis = scipy.stats.wilcoxon(x=avg_people_dvs, y=avg_people_fixed)
 
-    target_rows = people_accuracy.loc[people_accuracy['mode'].isin(['DVS', 'Fixed CED'])]
-    plt.ylim(0, 102)
-    sns.boxplot(x=target_rows['mode'], y=target_rows['accuracy'] * 100, data=target_rows, whis=np.inf,
-                palette=box_colors)
-
-    sns.swarmplot(x=target_rows['mode'], y=target_rows['accuracy'] * 100, data=target_rows, color="white",
-                  edgecolor="black", linewidth=.5)
-    plt.title(f'Fixed CED and DVS', fontsize=12)
-    plt.suptitle(f'Percentage correct for identifying People', fontsize=16, y=0.98)
-    plt.show()
+    if not BATCH_PLOTS:
+        comparison_plot(**figures[1])
     print('ACCURACY')
     print("AUTOS")
     print(f'Gemiddelde voor accuracy in DVS: {np.average(avg_cars_dvs)}')
@@ -452,16 +437,8 @@ def fixed_dvs_comparison():
     avg_cars_dvs = car_confidence.loc[(car_confidence['mode'] == 'DVS')]['confidence'].to_list()
     avg_cars_fixed = car_confidence.loc[(car_confidence['mode'] == 'Fixed CED')]['confidence'].to_list()
 
-    target_rows = car_confidence.loc[car_confidence['mode'].isin(['DVS', 'Fixed CED'])]
-    plt.ylim(1, 5)
-    sns.boxplot(x=target_rows['mode'], y=target_rows['confidence'], data=target_rows, whis=np.inf,
-                palette=box_colors)
-
-    sns.swarmplot(x=target_rows['mode'], y=target_rows['confidence'], data=target_rows, color="white",
-                  edgecolor="black", linewidth=.5)
-    plt.title(f'Fixed CED and DVS', fontsize=12)
-    plt.suptitle(f'Confidence in identifying cars', fontsize=16, y=0.98)
-    plt.show()
+    if not BATCH_PLOTS:
+        comparison_plot(**figures[2])
 
     car_null_hypothesis = scipy.stats.ttest_rel(avg_cars_dvs, avg_cars_fixed, alternative='two-sided')
 
@@ -470,16 +447,8 @@ def fixed_dvs_comparison():
 
     people_null_hypothesis = scipy.stats.wilcoxon(x=avg_people_dvs, y=avg_people_fixed)
 
-    target_rows = people_confidence.loc[people_confidence['mode'].isin(['DVS', 'Fixed CED'])]
-    plt.ylim(1, 5)
-    sns.boxplot(x=target_rows['mode'], y=target_rows['confidence'], data=target_rows, whis=np.inf,
-                palette=box_colors)
-
-    sns.swarmplot(x=target_rows['mode'], y=target_rows['confidence'], data=target_rows, color="white",
-                  edgecolor="black", linewidth=.5)
-    plt.title(f'Fixed CED and DVS', fontsize=12)
-    plt.suptitle(f'Confidence in identifying people', fontsize=16, y=0.98)
-    plt.show()
+    if not BATCH_PLOTS:
+        comparison_plot(**figures[3])
 
     print("CONFIDENCE")
     print("AUTOS")
@@ -499,6 +468,92 @@ def fixed_dvs_comparison():
     print(people_null_hypothesis)
 
 
+def plot_key(function, kwargs: dict):
+    """
+    Hash of everything a figure is drawn from, the figure only has to be drawn again when this changes.
+    The source of the plot function is part of it, so figures are drawn again after the plot code changed.
+    :param function: Plot function
+    :param kwargs: Keyword arguments it is called with
+    :return: Hexadecimal SHA-1
+    """
+    key = hashlib.sha1(inspect.getsource(function).encode())
+    for name, value in sorted(kwargs.items()):
+        key.update(name.encode())
+        if isinstance(value, (pd.DataFrame, pd.Series)):
+            key.update(repr(value.columns if isinstance(value, pd.DataFrame) else value.name).encode())
+            key.update(pd.util.hash_pandas_object(value).to_numpy().tobytes())
+        else:
+            key.update(repr(value).encode())
+    return key.hexdigest()
+
+
+def init_plot_worker():
+    """
+    Process pool initializer, workers draw with the Agg backend (no display) in the same style as the main process.
+    """
+    plt.switch_backend('Agg')
+    sns.set(style="darkgrid")
+
+
+def render_plots(jobs: dict, plot_dir: str, workers: int = None):
+    """
+    Renders figures to files in a process pool. Figures whose input didn't change since the last run are skipped,
+    the keys of the rendered figures are kept in plots.json in 'plot_dir'.
+    :param jobs: {file name relative to plot_dir: (plot function, keyword arguments)}
+    :param plot_dir: Directory the figures are saved in
+    :param workers: Amount of processes, None uses one per CPU.
+    :return: Amount of figures rendered
+    """
+    manifest_path = os.path.join(plot_dir, 'plots.json')
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as file:
+            manifest = json.load(file)
+
+    todo = {}
+    for name, (function, kwargs) in jobs.items():
+        key = plot_key(function, kwargs)
+        path = os.path.join(plot_dir, name)
+        if manifest.get(name) != key or not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            todo[name] = (function, kwargs, path, key)
+    if not todo:
+        return 0
+
+    try:
+        with ProcessPoolExecutor(workers, initializer=init_plot_worker) as pool:
+            futures = {pool.submit(function, path=path, show=False, **kwargs): (name, key)
+                       for name, (function, kwargs, path, key) in todo.items()}
+            for future in as_completed(futures):
+                future.result()
+                name, key = futures[future]
+                manifest[name] = key
+    finally:
+        # Figures finished before an error are still skipped next run.
+        with fileutil.atomic_write(manifest_path, 'w') as file:
+            json.dump(manifest, file, indent=1)
+    return len(todo)
+
+
+def get_plot_jobs():
+    """
+    All figures of the analysis, for render_plots.
+    :return: {file name: (plot function, keyword arguments)}
+    """
+    jobs = {}
+    for mode in MODES:
+        jobs[f"learning_curve_{mode.replace(' ', '_').lower()}.png"] = (
+            plot_learning_curve, dict(mode=mode, curve=trial_accuracy.loc[mode], cutoff=CUTOFF))
+    for subject_id, target_rows in subject_answers_df.groupby('subject', sort=False):
+        jobs[os.path.join('individual', f"{subject_id}_bar.png")] = (
+            plot_individual, dict(subject_id=subject_id, target_rows=target_rows))
+    for modes, title in [(['DVS', 'Fixed CED'], 'Fixed CED and DVS'),
+                         (['Adaptive CED', 'Fixed CED'], 'Fixed CED and Adaptive CED')]:
+        for name, kwargs in comparison_figures(modes, title).items():
+            jobs[name] = (comparison_plot, kwargs)
+    return jobs
+
+
 if __name__ == '__main__':
     ANSWERS = {"stim1.mp4": {'cars': True, 'people': False},
                "stim2.mp4": {'cars': False, 'people': False},
@@ -520,27 +575,43 @@ if __name__ == '__main__':
 
     # Multiple subject analysis parameters
     CUTOFF = 0  # Confidence ratings equal to / smaller than this number will not be taken into consideration.
+    BATCH_PLOTS = False  # Render all figures to PLOT_DIR in a process pool without showing them, unchanged ones skipped.
+    PLOT_DIR = '.\\results\\plots\\'
+    DATA_DIR = '.\\results\\subjectdata\\'
+    USE_STAGE_CACHE = False  # Reuse the dataframes of an earlier run with the same subject data and parameters.
+    STAGE_CACHE_DIR = '.\\cache\\analysis\\'
     sns.set(style="darkgrid")
+    if BATCH_PLOTS:
+        plt.switch_backend('Agg')
     box_colors = {"Fixed CED": "b", "Adaptive CED": "darkorange", "DVS": "darkgreen"}
 
-    # Load all subject data.
-    a_subjects = load_test_subjects(base_loc=".\\results\\subjectdata\\adaptive\\", filename="combined_adaptive.json")
-    f_subjects = load_test_subjects(base_loc=".\\results\\subjectdata\\fixed\\", filename="combined_fixed.json")
-    # Convert JSON data to pandas dataframe
-    subject_answers_df = get_answers_df()
+    # Every stage is keyed by the content of the subject data and the parameters it depends on.
+    cache = stagecache.StageCache(STAGE_CACHE_DIR if USE_STAGE_CACHE else None)
+    data_hashes = [fileutil.file_hash(f"{DATA_DIR}{control}\\combined_{control}.json")
+                   for control in ['adaptive', 'fixed']] if USE_STAGE_CACHE else []
+    answers_key = stagecache.stage_key('answers', data_hashes, ANSWERS)
+    # Load all subject data and convert it to pandas dataframe
+    subject_answers_df = cache.get('answers', answers_key, load_answers_df)
 
     with pd.option_context('display.max_rows', None, 'display.max_columns', None):  # more options can be specified also
         print(subject_answers_df)
 
     MODES = ['Fixed CED', 'DVS', 'Adaptive CED']
     # Get pandas dataframe of study-population individual preformance.
-    car_accuracy, car_confidence, people_accuracy, people_confidence = get_average_sub_accuracy()
+    averages_key = stagecache.stage_key('subject_averages', answers_key, MODES)
+    car_accuracy, car_confidence, people_accuracy, people_confidence = get_average_sub_accuracy(
+        cache.get('subject_averages', averages_key, get_subject_averages))
     # For each mode calculate learning curve with R-pearson test
+    trial_accuracy = cache.get('trial_accuracy', stagecache.stage_key('trial_accuracy', answers_key, CUTOFF),
+                               get_trial_accuracy)
     for mode in MODES:
         learning_curve(mode)
 
-    for individual in range(30):
-        individual_scoring(str(individual))
+    if BATCH_PLOTS:
+        print(f"{render_plots(get_plot_jobs(), PLOT_DIR)} figures rendered to {PLOT_DIR}")
+    else:
+        for individual in range(30):
+            individual_scoring(str(individual))
 
     test_normality()
     fixed_dvs_comparison()
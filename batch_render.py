@@ -0,0 +1,127 @@
+"""
+This script renders edge detected versions of the stimuli without a display, for any amount of (threshold, sigma)
+settings. Videos and settings are spread over a pool of processes, every frame goes through the same
+preprocessing.canny_filter chain as fixed_render. Output is either an mp4 or an edgecache archive.
+"""
+
+import json
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import cv2
+import edgecache
+import preprocessing
+
+
+def make_jobs(videos: list, parameter_sets, fixed_canny_params: dict):
+    """
+    :param videos: Paths to videos
+    :param parameter_sets: List of (threshold, sigma) applied to every video, or 'fixed' to use fixed_canny_params.
+    :param fixed_canny_params: Per video (threshold, sigma), see .\\resource\\fixed_canny_params.json
+    :return: List of (video, threshold, sigma) to render.
+    """
+    jobs = []
+    for video in videos:
+        if parameter_sets == 'fixed':
+            threshold, sigma, _ = preprocessing.fixed_params(fixed_canny_params, video)
+            jobs.append((video, threshold, sigma))
+        else:
+            jobs.extend((video, threshold, sigma) for threshold, sigma in parameter_sets)
+    return jobs
+
+
+def output_path(output_dir: str, video: str, threshold: float, sigma: float, output_format: str):
+    """
+    :return: Path the rendered version of this video and settings is written to.
+    """
+    name = os.path.splitext(os.path.basename(video))[0]
+    extension = 'mp4' if output_format == 'video' else 'npz'
+    return os.path.join(output_dir, f"{name}_t{threshold:.1f}_s{sigma:.2f}.{extension}")
+
+
+def init_worker():
+    """
+    Every process works on its own video, so OpenCV threading inside a process only competes with the others.
+    """
+    cv2.setNumThreads(1)
+
+
+def render_job(video: str, threshold: float, sigma: float, size: tuple, output_format: str, output_dir: str):
+    """
+    Renders one video with one setting, runs inside a worker process.
+    :param video: Path to a video file
+    :param threshold: Canny threshold
+    :param sigma: Gaussian blur sigma
+    :param size: (width, height) of the stimulus
+    :param output_format: 'video' for an mp4, 'archive' for an edgecache archive.
+    :param output_dir: Directory to write to
+    :return: Dictionary with the job, the worker pid, amount of frames and time spent.
+    """
+    start = time.perf_counter()
+    path = output_path(output_dir, video, threshold, sigma, output_format)
+    if output_format == 'archive':
+        frame_count = edgecache.build(video, threshold, sigma, size, path)
+    else:
+        cap = cv2.VideoCapture(video)
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        writer = cv2.VideoWriter(path + '.tmp.mp4', cv2.VideoWriter_fourcc(*'mp4v'), fps, size, isColor=False)
+        frame_count = 0
+        _, video_frame = cap.read()
+        while video_frame is not None:
+            writer.write(preprocessing.canny_filter(video_frame, sigma=sigma, threshold=threshold, size=size))
+            frame_count += 1
+            _, video_frame = cap.read()
+        cap.release()
+        writer.release()
+        os.replace(path + '.tmp.mp4', path)
+    return {'video': video, 'threshold': threshold, 'sigma': sigma, 'pid': os.getpid(), 'frames': frame_count,
+            'seconds': time.perf_counter() - start}
+
+
+def render_all(jobs: list, size: tuple, output_format: str, output_dir: str, workers: int = None):
+    """
+    Renders all jobs over a process pool and prints the throughput of every job and every worker.
+    :param jobs: List of (video, threshold, sigma)
+    :param size: (width, height) of the stimulus
+    :param output_format: 'video' or 'archive'
+    :param output_dir: Directory to write to
+    :param workers: Amount of processes, None uses all cores.
+    :return: List of result dictionaries of render_job.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+        futures = [pool.submit(render_job, video, threshold, sigma, size, output_format, output_dir)
+                   for video, threshold, sigma in jobs]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            print(f"{os.path.basename(result['video'])} (threshold {result['threshold']:.1f}, "
+                  f"sigma {result['sigma']:.2f}): {result['frames']} frames, "
+                  f"{result['frames'] / result['seconds']:.1f} frames/s")
+
+    per_worker = defaultdict(lambda: [0, 0.0])
+    for result in results:
+        per_worker[result['pid']][0] += result['frames']
+        per_worker[result['pid']][1] += result['seconds']
+    for pid, (frames, seconds) in sorted(per_worker.items()):
+        print(f"worker {pid}: {frames} frames in {seconds:.1f}s, {frames / seconds:.1f} frames/s")
+    return results
+
+
+if __name__ == '__main__':
+    # -PARAMETERS- #
+    DATA_DIR = '.\\Dataset'  # Dataset downloadable at https://osf.io/s2udz (https://doi.org/10.1145/3458709.3458982)
+    SUBFOLDER = 'Original Videos'
+    OUTPUT_DIR = '.\\results\\rendered\\'
+    OUTPUT_FORMAT = 'video'  # choose from ['video', 'archive']
+    PARAMETER_SETS = 'fixed'  # 'fixed' for fixed_canny_params.json or a list of (threshold, sigma)
+    WORKERS = None  # Amount of processes, None uses all cores.
+    phosphene_imsize = (960, 960)  # Specify size of stimulus
+
+    with open('.\\resource\\fixed_canny_params.json', 'r') as params_file:
+        fixed_params = json.load(params_file)
+
+    all_jobs = make_jobs(preprocessing.find_videos(os.path.join(DATA_DIR, SUBFOLDER)), PARAMETER_SETS, fixed_params)
+    render_all(all_jobs, phosphene_imsize, OUTPUT_FORMAT, OUTPUT_DIR, WORKERS)
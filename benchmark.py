@@ -0,0 +1,133 @@
+"""
+This script benchmarks the per-frame processing chain of the pipelines (blur, Canny, resize, surface conversion and
+blit) without a monitor or a subject. Pygame runs on SDL's dummy video driver. Every combination of sigma, threshold,
+source resolution and stimulus size is timed on a sample video or on synthetic frames, the result is written to JSON.
+"""
+
+import itertools
+import json
+import os
+import time
+import cv2
+import numpy as np
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')  # Must be set before pygame opens a display.
+import pygame
+import display
+import preprocessing
+import profiler
+
+
+def synthetic_frames(resolution: tuple, count: int, seed: int = 0):
+    """
+    Moving shapes on a noisy background, enough structure for Canny to find edges.
+    :param resolution: (width, height) of the frames
+    :param count: Amount of frames
+    :param seed: Seed of the noise
+    :return: List of BGR frames
+    """
+    generator = np.random.default_rng(seed)
+    background = generator.integers(0, 60, (resolution[1], resolution[0], 3), dtype=np.uint8)
+    frames = []
+    for index in range(count):
+        frame = background.copy()
+        offset = index * resolution[0] // (2 * count)
+        cv2.rectangle(frame, (resolution[0] // 8 + offset, resolution[1] // 4),
+                      (resolution[0] // 3 + offset, resolution[1] // 2), (200, 180, 160), -1)
+        cv2.circle(frame, (resolution[0] * 2 // 3 - offset, resolution[1] * 2 // 3), resolution[1] // 8,
+                   (90, 220, 140), -1)
+        frames.append(frame)
+    return frames
+
+
+def video_frames(video: str, resolution: tuple, count: int):
+    """
+    :param video: Path to a video file
+    :param resolution: (width, height) the frames are resized to
+    :param count: Maximum amount of frames
+    :return: List of BGR frames
+    """
+    frames = []
+    cap = cv2.VideoCapture(video)
+    _, video_frame = cap.read()
+    while video_frame is not None and len(frames) < count:
+        frames.append(cv2.resize(video_frame, resolution))
+        _, video_frame = cap.read()
+    cap.release()
+    return frames
+
+
+def run_case(frames: list, screen, mode: str, sigma: float, threshold: float, size: tuple, max_sigma: float = 3):
+    """
+    Times the chain of fixed_render/adaptive_render on every frame.
+    :param frames: Source frames
+    :param screen: Pygame screen to blit to
+    :param mode: 'canny' for preprocessing.canny_filter, 'pyramid' for preprocessing.BlurPyramid
+    :param sigma: Gaussian blur sigma
+    :param threshold: Canny threshold
+    :param size: (width, height) of the stimulus
+    :param max_sigma: Highest sigma of the blur pyramid
+    :return: Dictionary with frames/s and latency percentiles in milliseconds.
+    """
+    frame_display = display.FrameDisplay(screen, center=(size[0] // 2, size[1] // 2))
+    pyramid = preprocessing.BlurPyramid(size, max_sigma) if mode == 'pyramid' else None
+    latencies = profiler.LatencyHistogram()
+    start = time.perf_counter_ns()
+    for frame in frames:
+        frame_start = time.perf_counter_ns()
+        if pyramid is not None:
+            pyramid.load(frame)
+            frame = pyramid.canny(sigma, threshold)
+        else:
+            frame = preprocessing.canny_filter(frame, sigma=sigma, threshold=threshold, size=size)
+        frame_display.show(frame)
+        pygame.display.flip()
+        latencies.record(time.perf_counter_ns() - frame_start)
+    seconds = (time.perf_counter_ns() - start) / 1e9
+    summary = latencies.summary()
+    return {'frames_per_second': len(frames) / seconds, 'p50_ms': summary['p50_ms'], 'p95_ms': summary['p95_ms'],
+            'p99_ms': summary['p99_ms'], 'max_ms': summary['max_ms']}
+
+
+def run_benchmark(sigmas: list, thresholds: list, resolutions: list, sizes: list, modes: list,
+                  frame_count: int = 100, video: str = None):
+    """
+    Runs run_case for every combination of the given settings.
+    :param video: Sample video, None uses synthetic frames.
+    :return: List of dictionaries with the settings and results of every case.
+    """
+    pygame.init()
+    results = []
+    for resolution in resolutions:
+        if video is not None:
+            frames = video_frames(video, resolution, frame_count)
+        else:
+            frames = synthetic_frames(resolution, frame_count)
+        for size in sizes:
+            screen = pygame.display.set_mode(size)
+            for mode, sigma, threshold in itertools.product(modes, sigmas, thresholds):
+                result = {'mode': mode, 'sigma': sigma, 'threshold': threshold, 'resolution': list(resolution),
+                          'size': list(size), 'frames': len(frames)}
+                result.update(run_case(frames, screen, mode, sigma, threshold, size))
+                print(f"{mode:8} {resolution[0]}x{resolution[1]} -> {size[0]}x{size[1]} sigma {sigma:<4} "
+                      f"threshold {threshold:<4}: {result['frames_per_second']:7.1f} frames/s, "
+                      f"p50 {result['p50_ms']:.2f} ms, p95 {result['p95_ms']:.2f} ms, p99 {result['p99_ms']:.2f} ms")
+                results.append(result)
+    pygame.quit()
+    return results
+
+
+if __name__ == '__main__':
+    # -PARAMETERS- #
+    VIDEO = None  # For example '.\\Dataset\\Original Videos\\sample1.mp4', None uses synthetic frames.
+    FRAME_COUNT = 100  # Frames per case
+    SIGMAS = [0.5, 1.5, 3]
+    THRESHOLDS = [50, 150, 300]
+    RESOLUTIONS = [(1280, 720), (1920, 1080), (3840, 2160)]  # Source resolutions
+    SIZES = [(480, 480), (960, 960)]  # phosphene_imsize values
+    MODES = ['canny', 'pyramid']  # 'canny' is the default chain, 'pyramid' is USE_BLUR_PYRAMID.
+    OUTPUT = '.\\results\\benchmark.json'
+
+    benchmark_results = run_benchmark(SIGMAS, THRESHOLDS, RESOLUTIONS, SIZES, MODES, FRAME_COUNT, VIDEO)
+    with open(OUTPUT, 'w') as file:
+        json.dump({'video': VIDEO, 'opencv': cv2.__version__, 'results': benchmark_results}, file, indent=2)
+        file.close()
@@ -5,6 +5,7 @@ This is script is made purely for demonstration purposes. It's mostly a copy-pas
 with some hard coded nonsense.
 """
 import cv2
+import display
 import objects
 import imgproc
 import prompt
@@ -81,6 +82,10 @@ threshold = 150
 sigma = 1.5
 pygame.event.set_grab(True)  # Locks cursor within boundaries of window
 pygame.mouse.set_visible(False)  # Make cursor invisible
+center_display = display.FrameDisplay(screen, center=(width // 2, heigth // 2))
+left_display = display.FrameDisplay(screen, center=(width // 4, heigth // 2))
+right_display = display.FrameDisplay(screen, center=(width * .75, heigth // 2))
+phosphene_display = display.FrameDisplay(screen, center=(width // 2, heigth // 2))
 while True:
     max = len(frames_in_list)
     frame = frames_in_list[frame_index]
@@ -102,29 +107,22 @@ while True:
 
     if display_mode == 1:
         pygame.draw.rect(screen, 'BLACK', rect=pygame.Rect(0, 0, width, heigth))
-        frame = frame[:, :, ::-1]
-        frame = pygame.surfarray.make_surface(frame)
-        frame = pygame.transform.rotate(frame, -90)
-        screen.blit(frame, frame.get_rect(center=(width // 2, heigth // 2)))
+        center_display.show(frame[:, :, ::-1])
 
     if display_mode == 2 or display_mode == 3:
         # for y (which controls sigma) range starts from 1px because sigma cannot be 0.
         pygame.draw.rect(screen, 'BLACK', rect=pygame.Rect(0, 0, width, heigth))
         original_frame = frame[:, :, ::-1]
-        original_frame = pygame.surfarray.make_surface(original_frame)
-        original_frame = pygame.transform.rotate(original_frame, -90)
         frame = imgproc.cannyfilter(frame, sigma=sigma, high_threshold=threshold)
         # phosphene simulation
         frame = cv2.resize(frame, phosphene_imsize)
         frame = simulator(frame)
-        frame = pygame.surfarray.make_surface(frame)
-        frame = pygame.transform.rotate(frame, -90)
         if display_mode == 2:
-            screen.blit(original_frame, original_frame.get_rect(center=(width // 4, heigth // 2)))
-            screen.blit(frame, frame.get_rect(center=(width * .75, heigth // 2)))
+            left_display.show(original_frame)
+            right_display.show(frame)
         else:
             pygame.draw.rect(screen, 'BLACK', rect=pygame.Rect(0, 0, width, heigth))
-            screen.blit(frame, frame.get_rect(center=(width // 2, heigth // 2)))
+            phosphene_display.show(frame)
 
     if display_mode == 4:
         prompt.ExperimentForm(vid_id='', title_bar=1, subject_data=dummy_subject)
@@ -0,0 +1,47 @@
+"""
+In this script the drawing of video frames to the pygame screen is written. Before, every frame was turned into a new
+surface with pygame.surfarray.make_surface and then into another one by pygame.transform.rotate(frame, -90).
+Here one surface is kept and every frame is copied into it, with that rotation done as a numpy view.
+"""
+
+import pygame
+
+
+class FrameDisplay:
+    def __init__(self, screen, center: tuple):
+        """
+        Draws numpy frames to the screen through one persistent surface. The surface is made on the first frame
+        and only made again if the frame size changes, so call this after pygame.display.set_mode.
+        :param screen: A Pygame.screen to draw frames to
+        :param center: (x, y) the center of each frame is drawn at.
+        """
+        self.screen = screen
+        self.center = center
+        self.surface = None
+        self.rect = None
+
+    def show(self, frame, profiler=None):
+        """
+        Copies a frame into the persistent surface and blits it to the screen, pygame.display.flip() isn't called.
+        Shows exactly what make_surface + rotate(-90) showed, including the 8-bit palette for single channel frames.
+        :param frame: 2D uint8 array (height, width) or 3D RGB array (height, width, 3).
+        :param profiler: Optional profiler.FrameProfiler, the surface conversion and blit stages are marked on it.
+        """
+        # make_surface reads the array as (x, y) and rotate(-90) turns that clockwise, combined this means
+        # pixel (x, y) on screen is frame[y, width - 1 - x]. That is this view, so no rotated surface is needed.
+        if frame.ndim == 2:
+            view = frame[:, ::-1].T
+        else:
+            view = frame[:, ::-1].transpose(1, 0, 2)
+
+        if self.surface is None or self.surface.get_size() != view.shape[:2] or \
+                (self.surface.get_bitsize() == 8) != (frame.ndim == 2):
+            self.surface = pygame.Surface(view.shape[:2], depth=8 if frame.ndim == 2 else 32)
+            self.rect = self.surface.get_rect(center=self.center)
+
+        pygame.surfarray.blit_array(self.surface, view)
+        if profiler is not None:
+            profiler.mark('surface conversion')
+        self.screen.blit(self.surface, self.rect)
+        if profiler is not None:
+            profiler.mark('blit')
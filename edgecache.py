@@ -0,0 +1,222 @@
+"""
+In this script the caches of edge detected stimuli are written. For the fixed condition threshold and sigma
+never change per video, so every edge map only has to be computed once instead of on every frame of every loop.
+Edge maps are run-length encoded (they are mostly black) and stored per (video, threshold, sigma, size and the
+WORKING_WIDTH and GRAYSCALE_EDGES settings of the pipeline).
+For the adaptive condition parameters are snapped to a grid and edge maps are kept in memory (GridEdgeCache).
+
+Run this script to precompute the cache for all stimuli before running subjects.
+"""
+
+import hashlib
+import json
+import os
+from collections import OrderedDict
+import cv2
+import numpy as np
+import fileutil
+import preprocessing
+
+
+def cache_path(cache_dir: str, video: str, threshold: float, sigma: float, size: tuple, working_width: int = None,
+               grayscale: bool = False):
+    """
+    File size and modification time of the video are part of the key like in framestore.store_path, a replaced
+    video never uses stale edge maps and opening a trial doesn't read the whole video.
+    working_width and grayscale change the edge maps as well, so edge maps built with other settings are never used.
+    :return: Path of the cache file belonging to this video and these parameters.
+    """
+    stat = os.stat(video)
+    key = f"{stat.st_size}-{int(stat.st_mtime)}-{threshold:.6f}-{sigma:.6f}-{size[0]}x{size[1]}-{working_width}-" \
+          f"{'gray' if grayscale else 'bgr'}"
+    name = os.path.splitext(os.path.basename(video.replace('\\', '/')))[0]
+    return os.path.join(cache_dir, f"{name}_{hashlib.sha1(key.encode()).hexdigest()[:16]}.npz")
+
+
+def run_length_encode(frame):
+    """
+    :param frame: 2D uint8 array
+    :return: (values, lengths) of all runs in the flattened frame.
+    """
+    flat = frame.ravel()
+    starts = np.concatenate(([0], np.flatnonzero(flat[1:] != flat[:-1]) + 1))
+    lengths = np.diff(np.append(starts, flat.size))
+    return flat[starts], lengths.astype(np.uint32)
+
+
+def build(video: str, threshold: float, sigma: float, size: tuple, path: str, working_width: int = None,
+          grayscale: bool = False):
+    """
+    Decodes a video once, edge detects every frame and writes the run-length encoded result to 'path'.
+    :param video: Path to a video file
+    :param threshold: Canny threshold
+    :param sigma: Gaussian blur sigma
+    :param size: (width, height) of the stimulus
+    :param path: Cache file to write
+    :param working_width: WORKING_WIDTH of the pipeline, see preprocessing.canny_filter.
+    :param grayscale: Edge detect luminance like GRAYSCALE_EDGES of the pipeline, otherwise the BGR frames.
+    :return: Amount of frames written
+    """
+    values = []
+    lengths = []
+    offsets = [0]
+    cap = cv2.VideoCapture(video)
+    _, video_frame = cap.read()
+    while video_frame is not None:
+        if grayscale:  # The same conversion framesource.FrameStream does at decode.
+            video_frame = cv2.cvtColor(video_frame, cv2.COLOR_BGR2GRAY)
+        frame_values, frame_lengths = run_length_encode(preprocessing.canny_filter(
+            video_frame, sigma=sigma, threshold=threshold, size=size, working_width=working_width))
+        values.append(frame_values)
+        lengths.append(frame_lengths)
+        offsets.append(offsets[-1] + len(frame_values))
+        _, video_frame = cap.read()
+    cap.release()
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with fileutil.atomic_write(path) as file:
+        np.savez(file, values=np.concatenate(values), lengths=np.concatenate(lengths),
+                 offsets=np.array(offsets, dtype=np.int64), shape=np.array([size[1], size[0]]))
+    return len(offsets) - 1
+
+
+class EdgeFrames:
+    def __init__(self, path: str):
+        """
+        Precomputed edge maps of one video. Iterating over this object gives one pass over the video, the same as
+        framesource.FrameStream, but the frames are already blurred, edge detected and resized.
+        :param path: Cache file written by build()
+        """
+        with np.load(path) as data:
+            self.values = data['values']
+            self.lengths = data['lengths']
+            self.offsets = data['offsets']
+            self.shape = tuple(data['shape'])
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int):
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return np.repeat(self.values[start:end], self.lengths[start:end]).reshape(self.shape)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def close(self):
+        """
+        Nothing is decoded in the background, this only exists so EdgeFrames can be used like a FrameStream.
+        """
+        return
+
+
+class GridEdgeCache:
+    def __init__(self, max_threshold: float, max_sigma: float, threshold_step: float, sigma_step: float,
+                 size: tuple, budget_mb: int = 512):
+        """
+        Least recently used cache of edge maps per (frame index, grid cell) for the adaptive condition.
+        Mouse positions are snapped to a (threshold, sigma) grid, so returning to the same spot in a later loop of
+        the video costs a dictionary lookup instead of a blur and Canny.
+        :param max_threshold: Highest threshold the mouse can select.
+        :param max_sigma: Highest sigma the mouse can select.
+        :param threshold_step: Distance between two threshold values on the grid.
+        :param sigma_step: Distance between two sigma values on the grid, this is also the lowest sigma.
+        :param size: (width, height) of the stimulus
+        :param budget_mb: Maximum memory used by the cached edge maps in megabytes.
+        """
+        self.max_threshold = max_threshold
+        self.max_sigma = max_sigma
+        self.threshold_step = threshold_step
+        self.sigma_step = sigma_step
+        self.size = size
+        self.budget = budget_mb * 1024 * 1024
+        self.used = 0
+        self.hits = 0
+        self.misses = 0
+        self._edges = OrderedDict()
+
+    def cell(self, threshold: float, sigma: float):
+        """
+        :return: (threshold index, sigma index) of the grid cell these parameters fall in.
+        """
+        threshold_index = int(round(min(max(threshold, 0), self.max_threshold) / self.threshold_step))
+        # Sigma cannot be 0, so the lowest cell is one step.
+        sigma_index = max(1, int(round(min(sigma, self.max_sigma) / self.sigma_step)))
+        return threshold_index, sigma_index
+
+    def quantize(self, threshold: float, sigma: float):
+        """
+        :return: The threshold and sigma that are actually shown for these parameters.
+        """
+        threshold_index, sigma_index = self.cell(threshold, sigma)
+        return round(threshold_index * self.threshold_step, 6), round(sigma_index * self.sigma_step, 6)
+
+    def get(self, frame_index: int, frame, threshold: float, sigma: float):
+        """
+        Returns the edge map of a frame for the grid cell of (threshold, sigma), computing it if not cached.
+        :param frame_index: Index of the frame within the video
+        :param frame: The video frame itself, only used when the edge map isn't cached.
+        :param threshold: Canny threshold
+        :param sigma: Gaussian blur sigma
+        :return: Edge map resized to 'size', must not be modified.
+        """
+        key = (frame_index,) + self.cell(threshold, sigma)
+        edges = self._edges.get(key)
+        if edges is not None:
+            self._edges.move_to_end(key)
+            self.hits += 1
+            return edges
+
+        self.misses += 1
+        threshold, sigma = self.quantize(threshold, sigma)
+        edges = preprocessing.canny_filter(frame, sigma=sigma, threshold=threshold, size=self.size)
+        self._edges[key] = edges
+        self.used += edges.nbytes
+        while self.used > self.budget and len(self._edges) > 1:
+            _, evicted = self._edges.popitem(last=False)
+            self.used -= evicted.nbytes
+        return edges
+
+
+def load(video: str, threshold: float, sigma: float, size: tuple, cache_dir: str, working_width: int = None,
+         grayscale: bool = False):
+    """
+    Returns the cached edge maps of a video. Missing edge maps are not built here, building takes as long as
+    decoding the whole video, which would stall the start of a trial. Run this script to precompute them.
+    :param video: Path to a video file
+    :param threshold: Canny threshold
+    :param sigma: Gaussian blur sigma
+    :param size: (width, height) of the stimulus
+    :param cache_dir: Directory with cache files
+    :param working_width: WORKING_WIDTH of the pipeline, see build()
+    :param grayscale: GRAYSCALE_EDGES of the pipeline, see build()
+    :return: EdgeFrames object, None if the edge maps weren't precomputed with these settings.
+    """
+    path = cache_path(cache_dir, video, threshold, sigma, size, working_width, grayscale)
+    if not os.path.exists(path):
+        return None
+    return EdgeFrames(path)
+
+
+if __name__ == '__main__':
+    DATA_DIR = '.\\Dataset'  # Dataset downloadable at https://osf.io/s2udz (https://doi.org/10.1145/3458709.3458982)
+    SUBFOLDER = 'Original Videos'
+    EDGE_CACHE_DIR = '.\\cache\\edges\\'
+    phosphene_imsize = (960, 960)  # Specify size of stimulus
+    WORKING_WIDTH = None  # Same as in modified_pipeline.py, edge maps built with other settings are never used.
+    GRAYSCALE_EDGES = False  # Same as in modified_pipeline.py
+
+    with open('.\\resource\\fixed_canny_params.json', 'r') as params_file:
+        fixed_canny_params = json.load(params_file)
+
+    for video_path in preprocessing.find_videos(os.path.join(DATA_DIR, SUBFOLDER)):
+        filename = os.path.basename(video_path)
+        threshold, sigma, _ = preprocessing.fixed_params(fixed_canny_params, video_path)
+        target = cache_path(EDGE_CACHE_DIR, video_path, threshold, sigma, phosphene_imsize, WORKING_WIDTH,
+                            GRAYSCALE_EDGES)
+        if os.path.exists(target):
+            print(f"{filename}: already cached")
+            continue
+        frame_count = build(video_path, threshold, sigma, phosphene_imsize, target, WORKING_WIDTH, GRAYSCALE_EDGES)
+        print(f"{filename}: {frame_count} frames cached")
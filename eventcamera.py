@@ -0,0 +1,100 @@
+"""
+In this script the DVS (event camera) emulator is written. The original pipeline showed pre-rendered DVS videos,
+here ON/OFF events are made from consecutive frames of the ordinary stimuli while they are played. Every pixel keeps
+the log intensity at its last event, a new event fires each time the log intensity moved 'threshold' away from it.
+"""
+
+import cv2
+import numpy as np
+
+
+class DVSEmulator:
+    def __init__(self, size: tuple = None, threshold: float = 0.2):
+        """
+        :param size: (width, height) frames are resized to before emulation, None keeps the source resolution.
+        :param threshold: Contrast threshold, change in log intensity needed for one event.
+        """
+        self.size = size
+        self.threshold = threshold
+        self.reference = None
+        self._log = None
+        self._events = None
+        self._step = None
+
+    def reset(self):
+        """
+        Forgets the reference, the next frame gives no events. Call at the start of every loop over a video.
+        """
+        self.reference = None
+
+    def __call__(self, frame):
+        """
+        :param frame: BGR or grayscale video frame
+        :return: Signed amount of events per pixel (float32, positive is ON, negative is OFF). Only valid until the
+            next call, the array is reused.
+        """
+        if frame.ndim == 3:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if self.size is not None and frame.shape[1::-1] != self.size:  # Not yet resized at decode.
+            frame = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        if self._log is None or self._log.shape != frame.shape:
+            self._log = np.empty(frame.shape, np.float32)
+            self._events = np.empty(frame.shape, np.float32)
+            self._step = np.empty(frame.shape, np.float32)
+            self.reference = None
+        np.log1p(frame, out=self._log, dtype=np.float32)
+
+        if self.reference is None:
+            self.reference = self._log.copy()
+            self._events.fill(0)
+            return self._events
+
+        # All in place, no arrays are allocated per frame.
+        np.subtract(self._log, self.reference, out=self._events)
+        np.divide(self._events, self.threshold, out=self._events)
+        np.trunc(self._events, out=self._events)
+        np.multiply(self._events, self.threshold, out=self._step)
+        np.add(self.reference, self._step, out=self.reference)
+        return self._events
+
+
+class DVSStream:
+    def __init__(self, frame_source, size: tuple = None, threshold: float = 0.2, frames_per_display: int = 1):
+        """
+        Streaming stage turning a frame source into DVS frames. The events of 'frames_per_display' source frames are
+        accumulated into one frame, white where any event fired. Iterating over this object gives one pass.
+        :param frame_source: framesource.FrameStream or any iterable of video frames
+        :param size: (width, height) of the DVS frames
+        :param threshold: Contrast threshold of the DVSEmulator
+        :param frames_per_display: Source frames per shown frame, source framerate / display framerate.
+        """
+        self.frame_source = frame_source
+        self.frames_per_display = max(1, frames_per_display)
+        self.emulator = DVSEmulator(size, threshold)
+
+    def __len__(self):
+        return -(-len(self.frame_source) // self.frames_per_display)
+
+    def __iter__(self):
+        self.emulator.reset()  # The jump back to the first frame is no motion.
+        accumulated = None
+        count = 0
+        for frame in self.frame_source:
+            events = self.emulator(frame)
+            if accumulated is None:
+                accumulated = np.zeros(events.shape, np.float32)
+            np.add(accumulated, np.abs(events), out=accumulated)
+            count += 1
+            if count == self.frames_per_display:
+                yield np.where(accumulated > 0, np.uint8(255), np.uint8(0))
+                accumulated.fill(0)
+                count = 0
+        if count:
+            yield np.where(accumulated > 0, np.uint8(255), np.uint8(0))
+
+    def close(self):
+        """
+        Closes the frame source.
+        """
+        self.frame_source.close()
+
@@ -0,0 +1,41 @@
+"""
+In this script the file helpers shared by the caches and result files are written.
+"""
+
+import contextlib
+import hashlib
+import os
+
+
+def file_hash(path: str, chunk_size: int = 1 << 20):
+    """
+    Hashes the content of a file, so a replaced file with the same name is never mistaken for the old one.
+    :param path: Path to a file
+    :param chunk_size: Amount of bytes read at once.
+    :return: sha1 hex digest
+    """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@contextlib.contextmanager
+def atomic_write(path: str, mode: str = 'wb'):
+    """
+    Opens a temporary file next to 'path' and moves it over 'path' once the block is done, so an interrupted write
+    never leaves a half written file. After an error the temporary file is removed and 'path' is left as it was.
+    :param path: File to write
+    :param mode: 'wb' or 'w'
+    :return: The open temporary file
+    """
+    temporary = path + '.tmp'
+    try:
+        with open(temporary, mode) as file:
+            yield file
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+    os.replace(temporary, path)
@@ -0,0 +1,140 @@
+"""
+In this script the frame source used by both pipelines is written. Instead of decoding a whole video into a list
+before playback, frames are decoded on a background thread into a small bounded buffer.
+"""
+
+import queue
+import threading
+import cv2
+
+
+class FrameStream:
+    def __init__(self, video: str, buffer_size: int = 32, passes: int = None, step: int = 1, transform=None,
+                 grayscale: bool = False, size: tuple = None):
+        """
+        Streams the frames of a video from a background decode thread, memory stays at 'buffer_size' frames however
+        long the video is. Iterating over this object gives one pass over the video, iterating again rewinds it.
+        The decode thread starts right away so the first frames are ready by the time playback starts.
+        :param video: Path to a video file
+        :param buffer_size: Maximum amount of decoded frames held in memory.
+        :param passes: Amount of times the video will be played, the decode thread stops after this. None is endless.
+        :param step: Only every 'step'-th frame is decoded, skipped frames are grabbed but never decoded.
+        :param transform: Optional function applied to each frame on the decode thread (for example cv2.flip).
+        :param grayscale: Convert frames to single channel on the decode thread, a third of the memory and no
+            cvtColor per frame and loop for stages that only use luminance (DVS, blur pyramid).
+        :param size: (width, height) frames are resized to (INTER_AREA) on the decode thread, None keeps them.
+        """
+        self.video = video
+        self.buffer_size = buffer_size
+        self.passes = passes
+        self.step = step
+        self.transform = transform
+        self.grayscale = grayscale
+        self.size = size
+
+        # Frame count is read from the container, so no decoding is needed to know the length.
+        cap = cv2.VideoCapture(video)
+        self.frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.fps = cap.get(cv2.CAP_PROP_FPS)
+        cap.release()
+
+        self._buffer = None
+        self._stop = None
+        self._thread = None
+        self._pass_complete = True
+        self._consumed = 0
+        self.start()
+
+    def __len__(self):
+        return -(-self.frame_count // self.step)  # ceil division, same as len(range(0, frame_count, step))
+
+    def __iter__(self):
+        # A pass that was broken off halfway leaves frames of that pass in the buffer, so start over.
+        if not self._pass_complete or (self.passes is not None and self._consumed >= self.passes):
+            self.rewind()
+        self._pass_complete = False
+        while True:
+            frame = self._buffer.get()
+            if frame is None:  # End of pass marker.
+                break
+            yield frame
+        self._pass_complete = True
+        self._consumed += 1
+
+    def start(self):
+        """
+        Starts the decode thread from the first frame of the video.
+        """
+        self._buffer = queue.Queue(maxsize=self.buffer_size)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._decode, args=(self._buffer, self._stop), daemon=True)
+        self._thread.start()
+
+    def rewind(self):
+        """
+        Throws away whatever is buffered and restarts decoding from the first frame.
+        """
+        self.close()
+        self._pass_complete = True
+        self._consumed = 0
+        self.start()
+
+    def close(self):
+        """
+        Stops the decode thread and frees the buffer.
+        """
+        if self._thread is None:
+            return
+        self._stop.set()
+        # Empty the buffer so a decode thread blocked on a full buffer can see the stop event.
+        while self._thread.is_alive():
+            try:
+                self._buffer.get(timeout=0.05)
+            except queue.Empty:
+                pass
+        self._thread.join()
+        self._thread = None
+
+    def _put(self, buffer: queue.Queue, stop: threading.Event, item):
+        """
+        Blocking put which gives up once the stream is closed.
+        :return: False if the stream was closed while waiting.
+        """
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.05)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _decode(self, buffer: queue.Queue, stop: threading.Event):
+        """
+        Decode thread, fills the buffer with frames and puts None after every pass over the video.
+        """
+        played = 0
+        while not stop.is_set() and (self.passes is None or played < self.passes):
+            cap = cv2.VideoCapture(self.video)  # Reopening is the most reliable way of rewinding an mp4.
+            index = 0
+            while not stop.is_set():
+                if index % self.step != 0:
+                    if not cap.grab():
+                        break
+                    index += 1
+                    continue
+                _, video_frame = cap.read()
+                if video_frame is None:
+                    break
+                if self.transform is not None:
+                    video_frame = self.transform(video_frame)
+                if self.grayscale:
+                    video_frame = cv2.cvtColor(video_frame, cv2.COLOR_BGR2GRAY)
+                if self.size is not None:
+                    video_frame = cv2.resize(video_frame, self.size, interpolation=cv2.INTER_AREA)
+                if not self._put(buffer, stop, video_frame):
+                    break
+                index += 1
+            cap.release()
+            if not self._put(buffer, stop, None):
+                return
+            played += 1
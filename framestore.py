@@ -0,0 +1,125 @@
+"""
+In this script the frame store of the stimuli is written. Every video is decoded once into a raw uint8 file with a
+small header, trials open it with np.memmap. Nothing is decoded per trial anymore and the pages are shared between
+trials (and subjects) through the cache of the operating system.
+
+Run this script to convert all stimuli before running subjects.
+"""
+
+import os
+import struct
+import cv2
+import numpy as np
+import fileutil
+import preprocessing
+
+MAGIC = b'SPVFRAME'
+HEADER = struct.Struct('<8sIIIIId')  # magic, version, frame count, height, width, channels, fps
+HEADER_SIZE = 64  # Frames start at a fixed offset, so the header can grow without moving them.
+VERSION = 1
+
+
+def store_path(store_dir: str, video: str, grayscale: bool = False):
+    """
+    File size and modification time are part of the name, a replaced video never uses a stale store.
+    Hashing the content like edgecache does would read the whole video every trial.
+    :return: Path of the frame store belonging to this video.
+    """
+    stat = os.stat(video)
+    name = os.path.splitext(os.path.basename(video.replace('\\', '/')))[0]
+    return os.path.join(store_dir, f"{name}_{stat.st_size}_{int(stat.st_mtime)}{'_gray' if grayscale else ''}.frames")
+
+
+def convert(video: str, path: str, grayscale: bool = False):
+    """
+    Decodes a video once and writes all frames to 'path', one frame at a time so memory stays small.
+    :param video: Path to a video file
+    :param path: Frame store to write
+    :param grayscale: Store single channel frames, a third of the size.
+    :return: Amount of frames written
+    """
+    cap = cv2.VideoCapture(video)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    _, video_frame = cap.read()
+    if video_frame is None:  # A store without frames has no frame shape, np.memmap can't open it.
+        cap.release()
+        raise ValueError(f"No frames could be decoded from {video}, no frame store written")
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    frame_count = 0
+    shape = (0, 0, 0)
+    with fileutil.atomic_write(path) as file:
+        file.write(bytes(HEADER_SIZE))  # Header is written last, when the frame count is known.
+        while video_frame is not None:
+            if grayscale:
+                video_frame = cv2.cvtColor(video_frame, cv2.COLOR_BGR2GRAY)
+            video_frame = np.ascontiguousarray(video_frame, dtype=np.uint8)
+            shape = video_frame.shape if video_frame.ndim == 3 else video_frame.shape + (1,)
+            file.write(video_frame.tobytes())
+            frame_count += 1
+            _, video_frame = cap.read()
+        file.seek(0)
+        file.write(HEADER.pack(MAGIC, VERSION, frame_count, *shape, fps))
+    cap.release()
+    return frame_count
+
+
+class FrameStore:
+    def __init__(self, path: str):
+        """
+        Video frames of one stimulus, memory mapped. Iterating over this object gives one pass over the video, the
+        same as framesource.FrameStream. Frames are read-only views into the file.
+        :param path: Frame store written by convert()
+        """
+        with open(path, 'rb') as file:
+            magic, version, self.frame_count, height, width, channels, self.fps = \
+                HEADER.unpack(file.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a frame store of version {VERSION}")
+        shape = (self.frame_count, height, width) if channels == 1 else (self.frame_count, height, width, channels)
+        self.frames = np.memmap(path, dtype=np.uint8, mode='r', offset=HEADER_SIZE, shape=shape)
+
+    def __len__(self):
+        return self.frame_count
+
+    def __getitem__(self, index: int):
+        return self.frames[index]
+
+    def __iter__(self):
+        for index in range(self.frame_count):
+            yield self.frames[index]
+
+    def close(self):
+        """
+        Nothing to stop, the mapping is freed with this object.
+        """
+        return
+
+
+def load(video: str, store_dir: str, grayscale: bool = False):
+    """
+    Returns the frame store of a video, converting the video first if that wasn't done yet.
+    :param video: Path to a video file
+    :param store_dir: Directory with frame stores
+    :param grayscale: Use the single channel store
+    :return: FrameStore object
+    """
+    path = store_path(store_dir, video, grayscale)
+    if not os.path.exists(path):
+        convert(video, path, grayscale)
+    return FrameStore(path)
+
+
+if __name__ == '__main__':
+    DATA_DIR = '.\\Dataset'  # Dataset downloadable at https://osf.io/s2udz (https://doi.org/10.1145/3458709.3458982)
+    SUBFOLDER = 'Original Videos'
+    FRAME_STORE_DIR = '.\\cache\\frames\\'
+    GRAYSCALE = False  # Single channel stores, for DVS, USE_BLUR_PYRAMID or GRAYSCALE_EDGES in modified_pipeline.py
+
+    for video_path in preprocessing.find_videos(os.path.join(DATA_DIR, SUBFOLDER)):
+        filename = os.path.basename(video_path)
+        target = store_path(FRAME_STORE_DIR, video_path, GRAYSCALE)
+        if os.path.exists(target):
+            print(f"{filename}: already converted")
+            continue
+        print(f"{filename}: {convert(video_path, target, GRAYSCALE)} frames converted")
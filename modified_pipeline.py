@@ -1,19 +1,34 @@
 """
 # Author       : Paul Verhoeven
 # Date         : 06-07-2022
-This is a modified version of the pipeline. The phosphene simulator and DVS are excluded from this version.
+This is a modified version of the pipeline. The DVS videos are replaced by events emulated from the stimuli
+(eventcamera.py, see USE_DVS), the phosphene simulator of the Donders institute by phosphenes.py (see
+SIMULATE_PHOSPHENES). Both are off by default.
 This version is completely runable.
 """
 
-import cv2
+import display
+import edgecache
+import eventcamera
+import framesource
+import framestore
 import objects
 import json
+import numpy as np
 import os
+import phosphenes
+import preprocessing
+import profiler
 import prompt
+import recorder
+import renderpipeline
+import scheduler
+import sessionlog
 import pygame
 import pyautogui
 import random
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 
 def load_json(base: str, filename: str, data_type_is_subject: bool = False):
@@ -47,33 +62,129 @@ def load_json(base: str, filename: str, data_type_is_subject: bool = False):
         return None
 
 
-def save_subject_data(base: str, filename: str):
+def save_timing_data(base: str, filename: str):
     """
-    Saves the active_subject dictionary to .\\results\\ExperimentOneSubjectData.json.
-    :param filename: Json filename to load in.
+    Saves the frame timing summaries of all videos shown so far next to the subject data.
+    :param filename: Json filename to save to.
     :param base: base path to said filename.
-    :return: Returns dictionary, example: {0: first name-last name-subject_id}
     """
     with open(base + filename, 'w') as file:
-        json.dump(subject.get_object_as_dict(), file)
+        json.dump(timing_data, file)
         file.close()
     return
 
 
-def preload_video(video):
+def save_tracked_data(tracked_data: recorder.FrameRecorder, pre_start, subject: objects.Subject, video: str):
+    """
+    Saves the per-frame data of a video as .npz next to the subject data.
+    :param tracked_data: Recording of the video
+    :param pre_start: 'pre-start' dictionary, None if there is none.
+    :param subject: Subject object the actions are for, the practise subject (no id) is never saved.
+    :param video: Path to the video file
+    :return: Actions of this video to store in the subject, recorder.load_actions turns them back into the old format.
+    """
+    actions = dict() if pre_start is None else {'pre-start': pre_start}
+    if not COLUMNAR_TRACKING or subject.get_subject_id() == '':
+        actions.update(tracked_data.to_dict())
+        return actions
+    video_name = os.path.splitext(video.split('\\')[-1])[0]
+    actions['frames'] = f"frames\\subject_{subject.get_subject_id()}_{CONTROL}_{video_name}.npz"
+    tracked_data.save(f".\\results\\subjectdata\\{CONTROL}\\" + actions['frames'], pre_start)
+    return actions
+
+
+def get_fixed_params(video):
+    """
+    Looks up the Canny parameters of a video for the fixed condition.
+    :param video: Path to a video file
+    :return: threshold, sigma and whether the fallback values had to be used.
+    """
+    return preprocessing.fixed_params(fixed_canny_params, video)
+
+
+def get_dvs_videos(subject_id: str):
     """
-    Loads a video and splits it into frames_in_list.
+    Videos the fixed condition shows as DVS events to this subject. Like in the original experiment half of the videos
+    are DVS and half are edges, so both can be compared within the same subject.
+    :param subject_id: Subject id, its videos in resource\\fixed_vid_order.json are used if it's in there.
+    :return: Set of video names (stim1.mp4, ...)
+    """
+    order = fixed_vid_order.get(subject_id)
+    if order is not None:
+        return {video.split('\\')[-1] for video in order.values() if '\\DVS\\' in video}
+    names = sorted(video.split('\\')[-1] for video in filenames.get(MODE))
+    return set(random.Random(subject_id).sample(names, len(names) // 2))  # The same videos when resuming.
+
+
+def is_dvs(video):
+    """
+    :param video: Path to a video file of the experiment
+    :return: Whether this video is shown as DVS events.
+    """
+    return CONTROL == 'fixed' and USE_DVS and video.split('\\')[-1] in dvs_videos
+
+
+def preload_video(video, dvs: bool = False):
+    """
+    Opens a video as a frame stream, frames are decoded on a background thread while the countdown is shown.
+    In the fixed condition the precomputed edge maps are used instead, if they weren't precomputed with the current
+    settings (python edgecache.py) the video is edge detected live.
+    With USE_FRAME_STORE the decoded frames are memory mapped from disk (converted once if not done yet).
+    Frames are converted to grayscale once at decode if only luminance is used: for DVS (also resized to the stimulus
+    size), the blur pyramid and with GRAYSCALE_EDGES.
     :param video: Path to a video file
-    :return: A list of video split into frames_in_list in chronological order.
+    :param dvs: The video is shown as DVS events, which are emulated from the video frames so never cached.
+    :return: A framesource.FrameStream, framestore.FrameStore or edgecache.EdgeFrames giving the frames in
+        chronological order, once per loop.
+    """
+    if CONTROL == 'fixed' and USE_EDGE_CACHE and not dvs:
+        threshold, sigma, _ = get_fixed_params(video)
+        edges = edgecache.load(video, threshold, sigma, phosphene_imsize, EDGE_CACHE_DIR, WORKING_WIDTH,
+                               GRAYSCALE_EDGES)
+        if edges is not None:
+            return edges
+        print(f"WARNING: no precomputed edge maps of {video}, edge detecting live. Run edgecache.py first.")
+    grayscale = dvs or GRAYSCALE_EDGES or (CONTROL == 'adaptive' and USE_BLUR_PYRAMID and not USE_PARAM_GRID)
+    if USE_FRAME_STORE:
+        return framestore.load(video, FRAME_STORE_DIR, grayscale)
+    return framesource.FrameStream(video, buffer_size=BUFFER_FRAMES, passes=LOOP_AMOUNT, grayscale=grayscale,
+                                   size=phosphene_imsize if dvs else None)
+
+
+def prefetch_video(video, dvs: bool = False):
     """
-    frames_in_list = []
-    cap = cv2.VideoCapture(video)
-    _, video_frame = cap.read()
-    while video_frame is not None:
-        frames_in_list.append(video_frame)
-        _, video_frame = cap.read()
-    cap.release()
-    return frames_in_list
+    Starts opening the next video on a background thread, so it's decoding while the subject fills in the form.
+    :param video: Path to the next video file, None if there is no next video.
+    :param dvs: The next video is shown as DVS events, see preload_video.
+    """
+    global prefetched
+    if video is None:
+        return
+    prefetched = ((video, dvs), prefetch_pool.submit(preload_video, video, dvs))
+
+
+def load_video(video, dvs: bool = False):
+    """
+    Returns the frames of a video, prefetched by prefetch_video if possible. The time spent waiting for the video is
+    kept in load_wait and saved with the frame timing.
+    :param video: Path to a video file
+    :param dvs: The video is shown as DVS events, see preload_video.
+    :return: Same as preload_video
+    """
+    global prefetched, load_wait
+    start = time.perf_counter()
+    was_prefetched = prefetched is not None and prefetched[0] == (video, dvs)
+    if was_prefetched:
+        frames = prefetched[1].result()
+    else:
+        if prefetched is not None:  # Another video was prefetched, stop its decode thread.
+            prefetched[1].result().close()
+        frames = preload_video(video, dvs)
+    load_wait = {'seconds': time.perf_counter() - start, 'prefetched': was_prefetched}
+    if load_wait['seconds'] > 0.5:
+        print(f"WARNING: waited {load_wait['seconds']:.1f}s for {video}")
+    prefetched = None
+    return frames
 
 
 def videos_path():
@@ -105,6 +216,8 @@ def start_video_transition(screen):
     pygame.display.flip()
     text_font = pygame.font.Font('freesansbold.ttf', 32)
     countdown_font = pygame.font.Font('freesansbold.ttf', 64)
+    countdown_scheduler = scheduler.FrameScheduler(framerate=1)  # One number per second.
+    countdown_scheduler.start()
     for i in range(3):
         pygame.draw.rect(screen, 'BLACK', rect=pygame.Rect(0, 0, width, heigth))
         pygame.display.flip()
@@ -113,7 +226,7 @@ def start_video_transition(screen):
         string_countdown = countdown_font.render(f'{3 - i}', True, 'WHITE')
         screen.blit(string_countdown, string_countdown.get_rect(center=(width // 2, heigth // 2)))
         pygame.display.flip()
-        time.sleep(1)
+        countdown_scheduler.wait()
     pygame.draw.rect(screen, 'BLACK', rect=pygame.Rect(0, 0, width, heigth))
     pygame.display.flip()
     return
@@ -135,8 +248,9 @@ def loop_transition(screen, start_fg, start_bg, loops: int, transition_time: int
     pygame.draw.rect(screen, 'BLACK', rect=pygame.Rect(0, 0, width, heigth))
     pygame.display.flip()
     x = 0
+    transition_scheduler = scheduler.FrameScheduler(framerate=transition_fps)
+    transition_scheduler.start()
     while x < width:
-        start_frame = time.time()
         # Spacebar should still end video preemptively
         pygame.event.pump()
         key = pygame.key.get_pressed()
@@ -156,30 +270,57 @@ def loop_transition(screen, start_fg, start_bg, loops: int, transition_time: int
         font = pygame.font.Font('freesansbold.ttf', 64)
         text = font.render('Restarting video', True, 'BLACK')
         screen.blit(text, text.get_rect(center=(width // 2, heigth // 2)))
-        x += (width / (transition_time / (1 / transition_fps)))  # Each frame should add X amount of colour.
+        pygame.display.flip()
+
+        # custom fps timer. changing framerate with fps.clock, messes with the video framerate that comes after.
+        previous_slot = transition_scheduler.slot
+        # Each frame should add X amount of colour, skipped frames included so the transition time stays the same.
+        x += (width / (transition_time / (1 / transition_fps))) * (transition_scheduler.wait() - previous_slot)
 
         if x >= width and not reverse:  # Restart function with colors reversed.
             x = 0
             reverse = True
-        pygame.display.flip()
-
-        # custom fps timer. changing framerate with fps.clock, messes with the video framerate that comes after.
-        if time.time() - start_frame < 1 / transition_fps:
-            try:
-                time.sleep(1 / transition_fps - (time.time() - start_frame))
-            except ValueError:
-                pass
     pygame.draw.rect(screen, 'BLACK', rect=pygame.Rect(0, 0, width, heigth))
     pygame.display.flip()
     time.sleep(0.5)
     return loops
 
 
-def fixed_render(frames_in_list, subject: objects.Subject):
+def adaptive_edges(frame_index: int, frame, threshold: float, sigma: float, grid_cache=None, pyramid=None,
+                   frame_profiler=None):
+    """
+    Image pre-processing of the adaptive condition, also runs on the worker thread of a RenderPipeline.
+    :param frame_index: Index of the frame within the video, used by the grid cache.
+    :param frame: Video frame
+    :param threshold: Canny threshold
+    :param sigma: Gaussian blur sigma
+    :param grid_cache: edgecache.GridEdgeCache if USE_PARAM_GRID is set
+    :param pyramid: preprocessing.BlurPyramid if USE_BLUR_PYRAMID is set
+    :param frame_profiler: profiler.FrameProfiler on the pygame thread, profiler.StageTimer on the worker thread.
+    :return: Edge map at phosphene_imsize
+    """
+    if grid_cache is not None:
+        frame = grid_cache.get(frame_index, frame, threshold, sigma)
+        stage = 'edge cache'
+    elif pyramid is not None:
+        pyramid.load(frame)
+        frame = pyramid.canny(sigma, threshold)
+        stage = 'blur pyramid'
+    else:
+        return preprocessing.canny_filter(frame, sigma=sigma, threshold=threshold, size=phosphene_imsize,
+                                          profiler=frame_profiler, working_width=WORKING_WIDTH)
+    if frame_profiler is not None:
+        frame_profiler.mark(stage)
+    return frame
+
+
+def fixed_render(frame_source, subject: objects.Subject, dvs: bool = False):
     """
     This function handles the rendering of videos, tracking of user input and providing GUI's.
     :param subject: Subject object used to track user input.
-    :param frames_in_list: List with video frames
+    :param frame_source: framesource.FrameStream or framestore.FrameStore with video frames, or edgecache.EdgeFrames
+        with precomputed edge maps.
+    :param dvs: Show DVS events emulated from the video instead of edges, frame_source must give video frames.
     """
 
     # Initiate pygame stuff
@@ -188,32 +329,49 @@ def fixed_render(frames_in_list, subject: objects.Subject):
     screen = pygame.display.set_mode((0, 0), pygame.FULLSCREEN)
     pygame.event.set_grab(True)  # Locks cursor within boundaries of window
     pygame.mouse.set_visible(False)  # Make cursor invisible
+    frame_display = display.FrameDisplay(screen, center=(width // 2, heigth // 2))
+    frame_profiler = profiler.FrameProfiler(FRAMERATE)  # Times every stage of every frame.
+    frame_scheduler = scheduler.FrameScheduler(FRAMERATE)  # Presentation deadlines counted from the loop start.
     start_video_transition(screen)  # Countdown timer to video start
-    iterative_steps = range(0, len(frames_in_list))
     video_name = video_file.split('\\')[-1]
-    try:
-        assert fixed_canny_params.get(video_name) is not None
-        threshold = fixed_canny_params.get(video_name)[0]
-        sigma = fixed_canny_params.get(video_name)[1]
-        error = False
-    except AssertionError:
-        print(f"WARNING: no data points available for {video_name}")
-        threshold = 140
-        sigma = 1.5
-        error = True
+    if dvs:  # These 3 params are not important if the video is DVS.
+        threshold, sigma, error = None, None, None
+    else:
+        threshold, sigma, error = get_fixed_params(video_file)
+        if error:
+            print(f"WARNING: no data points available for {video_name}")
 
     # This start timer is used for tracking the total time spent in the video.
     timer = time.time()
-    tracked_data = dict()
+    phosphene_field = [('phosphenes', np.int32)] if simulator is not None else []
+    tracked_data = recorder.FrameRecorder(recorder.FIXED_FIELDS + phosphene_field)
     frame_counter = 0
     looped = 0
 
-    tracked_data['pre-start'] = {'DVS': False, 'sigma': sigma, 'threshold': threshold, 'canny_params_error': error}
+    pre_start = {'DVS': dvs, 'sigma': sigma, 'threshold': threshold, 'canny_params_error': error}
+
+    frames = frame_source
+    if dvs:  # ON/OFF events of consecutive frames, accumulated at the display framerate.
+        frames = eventcamera.DVSStream(frame_source, phosphene_imsize, DVS_THRESHOLD,
+                                       frames_per_display=round(frame_source.fps / FRAMERATE))
+    live_edges = not dvs and not isinstance(frame_source, edgecache.EdgeFrames)
+    if PIPELINED:  # Frames are processed on a worker thread, this loop only shows them.
+        if not live_edges:  # Decoding the cached edge maps or emulating the events still moves to the worker.
+            frames = renderpipeline.RenderPipeline(frames, lambda index, edges, params, stage_timer: edges,
+                                                   depth=PIPELINE_DEPTH)
+        else:  # Blur, canny and resize are timed on the worker, see profiler.StageTimer.
+            frames = renderpipeline.RenderPipeline(
+                frame_source, lambda index, video_frame, params, stage_timer: preprocessing.canny_filter(
+                    video_frame, sigma=sigma, threshold=threshold, size=phosphene_imsize, profiler=stage_timer,
+                    working_width=WORKING_WIDTH), depth=PIPELINE_DEPTH, frame_profiler=frame_profiler)
 
     while looped < LOOP_AMOUNT:  # Loop over video for 'LOOP_AMOUNT' times.
-        for frame in iterative_steps:
-            frame = frames_in_list[frame]
-
+        frame_profiler.restart()  # The countdown or loop transition before this isn't a slow frame.
+        frame_scheduler.start()
+        for frame_index, frame in enumerate(frames):
+            if frame_index < frame_scheduler.slot:  # Too late to be shown, skip to stay on schedule.
+                continue
+            frame_profiler.mark('frame source')
             # Once per frame, check if spacebar has been hit.
             pygame.event.pump()  # Allow pygame to handle internal actions.
             key = pygame.key.get_pressed()
@@ -222,20 +380,30 @@ def fixed_render(frames_in_list, subject: objects.Subject):
                 # (I do it like this everywhere!)
                 looped = LOOP_AMOUNT
                 break
-
-            # image pre-proceessing
-            frame = cv2.GaussianBlur(frame, (0, 0), sigma)  # gaussian blur (to remove noise)
-            frame = cv2.Canny(frame, threshold // 2, threshold)  # Canny edge detection
-            frame = cv2.resize(frame, phosphene_imsize)
-            frame = pygame.surfarray.make_surface(frame)
-            frame = pygame.transform.rotate(frame, -90)  # Rotation correction as np array of image is rotated 90.
-            screen.blit(frame, frame.get_rect(center=(width // 2, heigth // 2)))  # Add frame to center of pygame Frame.
+            frame_profiler.mark('event pump')
+
+            # image pre-proceessing, cached edge maps already are blurred, edge detected and resized.
+            if live_edges and not PIPELINED:
+                frame = preprocessing.canny_filter(frame, sigma=sigma, threshold=threshold, size=phosphene_imsize,
+                                                   profiler=frame_profiler, working_width=WORKING_WIDTH)
+            # phosphene simulation
+            if simulator is not None:
+                frame = simulator(frame)
+                frame_profiler.mark('phosphene simulation')
+            frame_display.show(frame, frame_profiler)  # Add frame to center of pygame Frame.
 
             pygame.display.flip()
+            frame_profiler.mark('flip')
 
-            tracked_data[frame_counter] = {'time': time.time() - timer, 'framerate': fps_clock.get_fps()}
+            if simulator is not None:
+                tracked_data.record(frame_counter, time=time.time() - timer, framerate=fps_clock.get_fps(),
+                                    phosphenes=simulator.count_phosphenes())
+            else:
+                tracked_data.record(frame_counter, time=time.time() - timer, framerate=fps_clock.get_fps())
             frame_counter += 1
-            fps_clock.tick(FRAMERATE)  # Limits FRAMERATE to FRAMERATE index_variable
+            fps_clock.tick()  # Only measures the framerate, frame_scheduler does the limiting.
+            frame_scheduler.wait()
+            frame_profiler.end_frame()
 
         looped += 1
         # Transition when video restarts
@@ -247,18 +415,26 @@ def fixed_render(frames_in_list, subject: objects.Subject):
                 break
 
     pygame.quit()
+    frame_source.close()  # Stop decoding, the form below can take a while.
+    prefetch_video(next_video, next_dvs)  # Next video is opened while the form is filled in.
+    timing_data[video_file] = frame_profiler.summary()
+    timing_data[video_file]['schedule'] = frame_scheduler.summary()
+    timing_data[video_file]['load_wait'] = load_wait
+    # Edge maps of the edge cache were blurred, edge detected and resized by edgecache.py, so those stages are not
+    # in the timing of this video.
+    timing_data[video_file]['edges'] = 'dvs' if dvs else 'live' if live_edges else 'precomputed'
 
     prompt.ExperimentForm(video_file, vid_nr + subject_progress + 1, subject)
 
     # update active_subject object
-    subject.update_actions(video_file, tracked_data)
+    subject.update_actions(video_file, save_tracked_data(tracked_data, pre_start, subject, video_file))
 
 
-def adaptive_render(frames_in_list, subject: objects.Subject):
+def adaptive_render(frame_source, subject: objects.Subject):
     """
     This function handles the rendering of videos, tracking of user input and providing GUI's.
     :param subject: Subject object used to track user input.
-    :param frames_in_list: List with video frames
+    :param frame_source: framesource.FrameStream or framestore.FrameStore with video frames
     """
 
     # Initiate pygame stuff
@@ -267,11 +443,26 @@ def adaptive_render(frames_in_list, subject: objects.Subject):
     screen = pygame.display.set_mode((0, 0), pygame.FULLSCREEN)
     pygame.event.set_grab(True)  # Locks cursor within boundaries of window
     pygame.mouse.set_visible(False)  # Make cursor invisible
+    frame_display = display.FrameDisplay(screen, center=(width // 2, heigth // 2))
+    frame_profiler = profiler.FrameProfiler(FRAMERATE)  # Times every stage of every frame.
+    frame_scheduler = scheduler.FrameScheduler(FRAMERATE)  # Presentation deadlines counted from the loop start.
     start_video_transition(screen)  # Countdown timer to video start
 
-    tracked_mouse_data = dict()
+    tracked_mouse_data = recorder.FrameRecorder(recorder.ADAPTIVE_FIELDS)
     frame_counter = 0
     looped = 0
+    grid_cache = None
+    if USE_PARAM_GRID:  # Edge maps are shared between loops, so only kept for the duration of this video.
+        grid_cache = edgecache.GridEdgeCache(MAX_THRESHOLD, MAX_SIGMA, THRESHOLD_STEP, SIGMA_STEP, phosphene_imsize,
+                                             budget_mb=GRID_CACHE_MB)
+    pyramid = None
+    if USE_BLUR_PYRAMID:
+        pyramid = preprocessing.BlurPyramid(phosphene_imsize, MAX_SIGMA, sigma_step=PYRAMID_SIGMA_STEP)
+    render_pipeline = None
+    if PIPELINED:  # Depth 1, so a mouse movement is shown on the next frame.
+        render_pipeline = renderpipeline.RenderPipeline(
+            frame_source, lambda index, video_frame, params, stage_timer: adaptive_edges(
+                index, video_frame, *params, grid_cache, pyramid, stage_timer), depth=1, frame_profiler=frame_profiler)
 
     # This start timer is used for tracking the total time spent in the video as well as time spent at specific coords.
     timer = time.time()
@@ -287,24 +478,44 @@ def adaptive_render(frames_in_list, subject: objects.Subject):
         # Note that sigma is reversed so that the top of the screen equals to the max. sigma.
         threshold = threshold_per_pixel * prev_x
         sigma = 3 - sigma_per_pixel * prev_y
-
-        for frame in frames_in_list:
+        if grid_cache is not None:  # Log the parameters that are actually shown.
+            threshold, sigma = grid_cache.quantize(threshold, sigma)
+        elif pyramid is not None:
+            sigma = pyramid.quantize(sigma)
+
+        frames = frame_source
+        if render_pipeline is not None:
+            render_pipeline.params = (threshold, sigma)  # Parameters of the first frame of this loop.
+            frames = render_pipeline
+
+        frame_profiler.restart()  # The countdown or loop transition before this isn't a slow frame.
+        frame_scheduler.start()
+        for frame_index, frame in enumerate(frames):
+            if frame_index < frame_scheduler.slot:  # Too late to be shown, skip to stay on schedule.
+                continue
+            frame_profiler.mark('frame source')
             # Once per frame, check mouse location.
             # records if it has changed and updates threshold and sigma accordingly.
             x, y = pygame.mouse.get_pos()
 
             if not forced_move:
-                tracked_mouse_data[frame_counter] = {'time': time.time() - timer, 'x': prev_x, 'y': prev_y,
-                                                     'threshold': threshold, 'sigma': sigma,
-                                                     'framerate': fps_clock.get_fps()}
+                tracked_mouse_data.record(frame_counter, time=time.time() - timer, x=prev_x, y=prev_y,
+                                          threshold=threshold, sigma=sigma, framerate=fps_clock.get_fps())
                 threshold = threshold_per_pixel * x
                 sigma = 3 - sigma_per_pixel * y
+                if grid_cache is not None:
+                    threshold, sigma = grid_cache.quantize(threshold, sigma)
+                elif pyramid is not None:
+                    sigma = pyramid.quantize(sigma)
                 prev_x = x
                 prev_y = y
 
             else:
                 forced_move = False
 
+            if render_pipeline is not None:  # Worker starts on the next frame while this one is shown.
+                render_pipeline.request((threshold, sigma))
+
             # Once per frame, check if spacebar has been hit.
             pygame.event.pump()  # Allow pygame to handle internal actions.
             key = pygame.key.get_pressed()
@@ -313,18 +524,23 @@ def adaptive_render(frames_in_list, subject: objects.Subject):
                 # (I do it like this everywhere!)
                 looped = LOOP_AMOUNT
                 break
-
-            # image pre-processing
-            frame = cv2.GaussianBlur(frame, (0, 0), sigma)  # gaussian blur (to remove noise)
-            frame = cv2.Canny(frame, threshold // 2, threshold)  # Canny edge detection
+            frame_profiler.mark('event pump')
+
+            # image pre-processing, already done by the worker if PIPELINED is set.
+            if render_pipeline is None:
+                frame = adaptive_edges(frame_index, frame, threshold, sigma, grid_cache, pyramid, frame_profiler)
+            # phosphene simulation
+            if simulator is not None:
+                frame = simulator(frame)
+                frame_profiler.mark('phosphene simulation')
             frame_counter += 1
-            frame = cv2.resize(frame, phosphene_imsize)
-            frame = pygame.surfarray.make_surface(frame)
-            frame = pygame.transform.rotate(frame, -90)  # Rotation correction as np array of image is rotated 90.
-            screen.blit(frame, frame.get_rect(center=(width // 2, heigth // 2)))  # Add frame to center of pygame Frame.
+            frame_display.show(frame, frame_profiler)  # Add frame to center of pygame Frame.
 
             pygame.display.flip()
-            fps_clock.tick(FRAMERATE)  # Limits FRAMERATE to FRAMERATE index_variable
+            frame_profiler.mark('flip')
+            fps_clock.tick()  # Only measures the framerate, frame_scheduler does the limiting.
+            frame_scheduler.wait()
+            frame_profiler.end_frame()
 
         looped += 1
         # Transition when video restarts
@@ -338,16 +554,21 @@ def adaptive_render(frames_in_list, subject: objects.Subject):
         if looped >= LOOP_AMOUNT:
             # Last recording is added to trace the last mouse position before ending video.
             # If recording was already made due to mouse movement it gets overwritten.
-            tracked_mouse_data[frame_counter] = {'time': time.time() - timer, 'x': prev_x, 'y': prev_y,
-                                                 'threshold': threshold, 'sigma': sigma,
-                                                 'framerate': fps_clock.get_fps()}
+            tracked_mouse_data.record(frame_counter, time=time.time() - timer, x=prev_x, y=prev_y,
+                                      threshold=threshold, sigma=sigma, framerate=fps_clock.get_fps())
 
     pygame.quit()
+    frame_source.close()  # Stop decoding, the form below can take a while.
+    prefetch_video(next_video, next_dvs)  # Next video is opened while the form is filled in.
+    timing_data[video_file] = frame_profiler.summary()
+    timing_data[video_file]['schedule'] = frame_scheduler.summary()
+    timing_data[video_file]['load_wait'] = load_wait
 
     prompt.ExperimentForm(video_file, vid_nr + subject_progress + 1, subject)
 
     # update active_subject object
-    subject.update_actions(filenames[MODE][vid_nr], tracked_mouse_data)
+    subject.update_actions(filenames[MODE][vid_nr],
+                           save_tracked_data(tracked_mouse_data, None, subject, filenames[MODE][vid_nr]))
 
 
 if __name__ == '__main__':
@@ -366,6 +587,27 @@ if __name__ == '__main__':
     FRAMERATE = 25  # Framerate video is played at.
     LOOP_AMOUNT = 10  # number of times a video should be replayed
     phosphene_imsize = (960, 960)  # Specify size of stimulus
+    BUFFER_FRAMES = 32  # Amount of decoded frames kept ahead of playback.
+    USE_FRAME_STORE = False  # Play decoded frames memory mapped from disk instead of decoding the mp4 every trial.
+    FRAME_STORE_DIR = '.\\cache\\frames\\'  # Convert once with: python framestore.py (needs a lot of disk space)
+    GRAYSCALE_EDGES = False  # Canny on luminance converted at decode, a third of the memory but slightly other edges.
+    USE_EDGE_CACHE = True  # Fixed condition plays precomputed edge maps instead of edge detecting every frame.
+    EDGE_CACHE_DIR = '.\\cache\\edges\\'  # Precompute with: python edgecache.py
+    USE_PARAM_GRID = False  # Adaptive condition snaps threshold and sigma to a grid and caches the edge maps.
+    THRESHOLD_STEP = 10  # Threshold grid spacing when USE_PARAM_GRID is set.
+    SIGMA_STEP = 0.1  # Sigma grid spacing when USE_PARAM_GRID is set, also the lowest sigma possible.
+    GRID_CACHE_MB = 512  # Memory budget of the adaptive edge map cache.
+    USE_BLUR_PYRAMID = False  # Adaptive condition blurs grayscale frames at stimulus size (cheaper for 4K stimuli).
+    PYRAMID_SIGMA_STEP = 0.1  # Sigma spacing of the blur levels when USE_BLUR_PYRAMID is set.
+    WORKING_WIDTH = None  # Downsample frames to this width before Canny, pick one with: python validation.py
+    PIPELINED = True  # Image processing runs on a worker thread ahead of the display loop.
+    PIPELINE_DEPTH = 2  # Frames processed ahead in the fixed condition, adaptive is always 1 frame.
+    USE_DVS = False  # Fixed condition shows half of the videos as emulated DVS events instead of edges.
+    DVS_THRESHOLD = 0.2  # Change in log intensity that makes a DVS pixel fire.
+    COLUMNAR_TRACKING = True  # Per-frame data is saved as .npz (recorder.py) instead of inside the subject JSON.
+    SIMULATE_PHOSPHENES = False  # Show phosphenes (phosphenes.py) instead of the edge maps.
+    PHOSPHENE_RESOLUTION = (50, 50)  # Amount of phosphenes, same as the original pipeline.
+    PHOSPHENE_INTENSITY = 10  # Stimulation intensity, same as the original pipeline.
 
     filenames, test_sample_videos = videos_path()  # List of videos and list of practise videos
     random.shuffle(filenames.get(MODE))  # Shuffle the list of videos randomly
@@ -373,6 +615,11 @@ if __name__ == '__main__':
     width, heigth = pyautogui.size()  # Fetch width and height of monitor in pixels
     threshold_per_pixel = MAX_THRESHOLD / width  # Increments/decreases threshold with this value per pixel.
     sigma_per_pixel = MAX_SIGMA / heigth  # Increments/decreases sigma with this value per pixel.
+    simulator = None
+    if SIMULATE_PHOSPHENES:
+        simulator = phosphenes.PhospheneSimulator(intensity=PHOSPHENE_INTENSITY,
+                                                  phosphene_resolution=PHOSPHENE_RESOLUTION, size=phosphene_imsize,
+                                                  dtype=np.float32)
 
     """
     !EXPERIMENT STARTS HERE!
@@ -383,16 +630,33 @@ if __name__ == '__main__':
 
     prompt.NewUserGUI(subject)
 
-    overwrite_subject = load_json(base=f".\\results\\subjectdata\\{CONTROL}\\",
-                                  filename=f"subject_{subject.get_subject_id()}_{CONTROL}.json",
-                                  data_type_is_subject=True)
+    # Every video is appended to the session log, run sessionlog.py to combine the logs for analyse.py.
+    session_log = sessionlog.SessionLog(f".\\results\\subjectdata\\{CONTROL}\\"
+                                        f"subject_{subject.get_subject_id()}_{CONTROL}.jsonl")
+    overwrite_subject = sessionlog.read(session_log.path)
+    saved_as_json = overwrite_subject is None
+    if saved_as_json:  # Subjects saved before the session log existed.
+        overwrite_subject = load_json(base=f".\\results\\subjectdata\\{CONTROL}\\",
+                                      filename=f"subject_{subject.get_subject_id()}_{CONTROL}.json",
+                                      data_type_is_subject=True)
 
     if overwrite_subject is not None:  # Check if subject ID already exists.
         if len(overwrite_subject.get_answers()) != 0:  # If subject ID already exists but is not used, restart.
             subject = overwrite_subject
 
+    # Frame timing of earlier sessions of this subject is kept when resuming.
+    timing_data = load_json(base=f".\\results\\subjectdata\\{CONTROL}\\",
+                            filename=f"subject_{subject.get_subject_id()}_{CONTROL}_timing.json")
+    if timing_data is None:
+        timing_data = dict()
+
     subject.set_order(filenames.get(MODE))
+    prefetch_pool = ThreadPoolExecutor(max_workers=1)  # Opens the next video in the background.
+    prefetched = None  # ((video, dvs), future) of the video being opened in the background.
+    load_wait = None
     fixed_canny_params = load_json(base=".\\resource\\", filename="fixed_canny_params.json")
+    fixed_vid_order = load_json(base=".\\resource\\", filename="fixed_vid_order.json") or dict()
+    dvs_videos = get_dvs_videos(subject.get_subject_id())  # Decided per video, DVS and edges within one subject.
 
     if len(subject.get_answers()) != 0:
         if len(subject.get_answers()) == 16:
@@ -419,30 +683,46 @@ if __name__ == '__main__':
         sample = 0
         for vid_nr in range(4):
             video_file = test_sample_videos.get('edge-detection')[vid_nr]
-            frames = preload_video(video_file)
+            dvs = CONTROL == 'fixed' and USE_DVS and vid_nr % 2 == 1  # Practise alternates edges and DVS.
+            if vid_nr < 3:
+                next_video = test_sample_videos.get('edge-detection')[vid_nr + 1]
+                next_dvs = CONTROL == 'fixed' and USE_DVS and vid_nr % 2 == 0
+            else:  # After the practise session the experiment continues where the subject is.
+                next_video = subject.get_vidorder()[len(subject.get_answers())]
+                next_dvs = is_dvs(next_video)
+            frames = load_video(video_file, dvs)
             if CONTROL == 'adaptive':
                 adaptive_render(frames, dummy_subject)
             elif CONTROL == 'fixed':
-                fixed_render(frames, dummy_subject)
+                fixed_render(frames, dummy_subject, dvs)
 
         prompt.StartExperiment(
             message=f"Practise is up!",
             button_str="Start experiment",
             window_str=f"Start subject {subject.get_subject_id()}")
 
+    # Only sessions that show videos are logged, a finished subject was sent away before the practise.
+    session_log.start(subject)
+    if saved_as_json:  # Videos already done are copied into the log once.
+        for done_video in subject.get_answers():
+            session_log.trial(subject, done_video)
+
     subject_progress = len(subject.get_answers())
     order = subject.get_vidorder()
 
     for vid_nr in range(subject_progress, 16):
         video_file = order[vid_nr]
-        frames = preload_video(video_file)
+        next_video = order[vid_nr + 1] if vid_nr + 1 < 16 else None
+        next_dvs = next_video is not None and is_dvs(next_video)
+        frames = load_video(video_file, is_dvs(video_file))
         if CONTROL == 'adaptive':
             adaptive_render(frames, subject)
         elif CONTROL == 'fixed':
-            fixed_render(frames, subject)
+            fixed_render(frames, subject, is_dvs(video_file))
 
-        # Save subject to JSON
-        save_subject_data(base=f".\\results\\subjectdata\\{CONTROL}\\",
-                          filename=f"subject_{subject.get_subject_id()}_{CONTROL}.json")
+        # Append this video to the session log
+        session_log.trial(subject, video_file)
+        save_timing_data(base=f".\\results\\subjectdata\\{CONTROL}\\",
+                         filename=f"subject_{subject.get_subject_id()}_{CONTROL}_timing.json")
 
     pygame.quit()
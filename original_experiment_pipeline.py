@@ -5,6 +5,8 @@ This is the main pipeline of this test. This was unmodified and cannot be run as
 """
 
 import cv2
+import display
+import framesource
 import objects
 import imgproc
 import json
@@ -60,20 +62,19 @@ def save_subject_data(base: str, filename: str):
     return
 
 
-def preload_video(video):
+def preload_video(video, step: int = 1, flip: bool = False):
     """
-    Loads a video and splits it into frames_in_list.
+    Opens a video as a frame stream, frames are decoded on a background thread while the countdown is shown.
     :param video: Path to a video file
-    :return: A list of video split into frames_in_list in chronological order.
+    :param step: Only every 'step'-th frame is shown (DVS videos have 4 times the framerate).
+    :param flip: Mirror every frame horizontally.
+    :return: A framesource.FrameStream giving the frames in chronological order, once per loop.
     """
-    frames_in_list = []
-    cap = cv2.VideoCapture(video)
-    _, video_frame = cap.read()
-    while video_frame is not None:
-        frames_in_list.append(video_frame)
-        _, video_frame = cap.read()
-    cap.release()
-    return frames_in_list
+    transform = None
+    if flip:
+        transform = lambda video_frame: cv2.flip(video_frame, 1)
+    return framesource.FrameStream(video, buffer_size=BUFFER_FRAMES, passes=LOOP_AMOUNT, step=step,
+                                   transform=transform)
 
 
 def videos_path():
@@ -175,11 +176,11 @@ def loop_transition(screen, start_fg, start_bg, loops: int, transition_time: int
     return loops
 
 
-def fixed_render(frames_in_list, subject: objects.Subject, dvs: bool = False):
+def fixed_render(frame_source, subject: objects.Subject, dvs: bool = False):
     """
     This function handles the rendering of videos, tracking of user input and providing GUI's.
     :param subject: Subject object used to track user input.
-    :param frames_in_list: List with video frames
+    :param frame_source: framesource.FrameStream with video frames, for DVS opened with step=4.
     """
 
     # Initiate pygame stuff
@@ -188,17 +189,16 @@ def fixed_render(frames_in_list, subject: objects.Subject, dvs: bool = False):
     screen = pygame.display.set_mode((0, 0), pygame.FULLSCREEN)
     pygame.event.set_grab(True)  # Locks cursor within boundaries of window
     pygame.mouse.set_visible(False)  # Make cursor invisible
+    frame_display = display.FrameDisplay(screen, center=(width // 2, heigth // 2))
     start_video_transition(screen)  # Countdown timer to video start
 
     if dvs:
-        # This video has more fps so only show every 4th frame, I have tested this and frames still align.
-        iterative_steps = range(0, len(frames_in_list), 4)
+        # This video has more fps so only every 4th frame is shown, preload_video is called with step=4 for this.
         # These 3 params are not important if the video is DVS.
         threshold = None
         sigma = None
         error = None
     else:
-        iterative_steps = range(0, len(frames_in_list))
         video_name = video_file.split('\\')[-1]
         try:
             assert fixed_canny_params.get(video_name) is not None
@@ -220,9 +220,7 @@ def fixed_render(frames_in_list, subject: objects.Subject, dvs: bool = False):
     tracked_data['pre-start'] = {'DVS': dvs, 'sigma': sigma, 'threshold': threshold, 'canny_params_error': error}
 
     while looped < LOOP_AMOUNT:  # Loop over video for 'LOOP_AMOUNT' times.
-        for frame in iterative_steps:
-            frame = frames_in_list[frame]
-
+        for frame in frame_source:
             # Once per frame, check if spacebar has been hit.
             pygame.event.pump()  # Allow pygame to handle internal actions.
             key = pygame.key.get_pressed()
@@ -240,9 +238,7 @@ def fixed_render(frames_in_list, subject: objects.Subject, dvs: bool = False):
             # phosphene simulation
             frame = cv2.resize(frame, phosphene_imsize)
             phosphenes = simulator(frame)
-            frame = pygame.surfarray.make_surface(phosphenes)
-            frame = pygame.transform.rotate(frame, -90)  # Rotation correction as np array of image is rotated 90.
-            screen.blit(frame, frame.get_rect(center=(width // 2, heigth // 2)))  # Add frame to center of pygame Frame.
+            frame_display.show(phosphenes)  # Add frame to center of pygame Frame.
 
             pygame.display.flip()
 
@@ -262,6 +258,7 @@ def fixed_render(frames_in_list, subject: objects.Subject, dvs: bool = False):
                 break
 
     pygame.quit()
+    frame_source.close()  # Stop decoding, the form below can take a while.
 
     prompt.ExperimentForm(video_file, vid_nr + subject_progress + 1, subject)
 
@@ -269,11 +266,11 @@ def fixed_render(frames_in_list, subject: objects.Subject, dvs: bool = False):
     subject.update_actions(video_file, tracked_data)
 
 
-def adaptive_render(frames_in_list, subject: objects.Subject):
+def adaptive_render(frame_source, subject: objects.Subject):
     """
     This function handles the rendering of videos, tracking of user input and providing GUI's.
     :param subject: Subject object used to track user input.
-    :param frames_in_list: List with video frames
+    :param frame_source: framesource.FrameStream with video frames
     """
 
     # Initiate pygame stuff
@@ -282,6 +279,7 @@ def adaptive_render(frames_in_list, subject: objects.Subject):
     screen = pygame.display.set_mode((0, 0), pygame.FULLSCREEN)
     pygame.event.set_grab(True)  # Locks cursor within boundaries of window
     pygame.mouse.set_visible(False)  # Make cursor invisible
+    frame_display = display.FrameDisplay(screen, center=(width // 2, heigth // 2))
     start_video_transition(screen)  # Countdown timer to video start
 
     tracked_mouse_data = dict()
@@ -303,7 +301,7 @@ def adaptive_render(frames_in_list, subject: objects.Subject):
         threshold = threshold_per_pixel * prev_x
         sigma = 3 - sigma_per_pixel * prev_y
 
-        for frame in frames_in_list:
+        for frame in frame_source:
             # Once per frame, check mouse location.
             # records if it has changed and updates threshold and sigma accordingly.
             x, y = pygame.mouse.get_pos()
@@ -335,9 +333,7 @@ def adaptive_render(frames_in_list, subject: objects.Subject):
             # phosphene simulation
             frame = cv2.resize(frame, phosphene_imsize)
             phosphenes = simulator(frame)
-            frame = pygame.surfarray.make_surface(phosphenes)
-            frame = pygame.transform.rotate(frame, -90)  # Rotation correction as np array of image is rotated 90.
-            screen.blit(frame, frame.get_rect(center=(width // 2, heigth // 2)))  # Add frame to center of pygame Frame.
+            frame_display.show(phosphenes)  # Add frame to center of pygame Frame.
 
             pygame.display.flip()
             fps_clock.tick(FRAMERATE)  # Limits FRAMERATE to FRAMERATE index_variable
@@ -359,6 +355,7 @@ def adaptive_render(frames_in_list, subject: objects.Subject):
                                                  'framerate': fps_clock.get_fps()}
 
     pygame.quit()
+    frame_source.close()  # Stop decoding, the form below can take a while.
 
     prompt.ExperimentForm(video_file, vid_nr + subject_progress + 1, subject)
 
@@ -384,6 +381,7 @@ if __name__ == '__main__':
     FRAMERATE = 25  # Framerate video is played at.
     LOOP_AMOUNT = 10  # number of times a video should be replayed
     phosphene_imsize = (960, 960)  # Specify size of stimulus
+    BUFFER_FRAMES = 32  # Amount of decoded frames kept ahead of playback.
 
     filenames, test_sample_videos = videos_path()  # List of videos and list of practise videos
     random.shuffle(filenames.get(MODE))  # Shuffle the list of videos randomly
@@ -446,11 +444,7 @@ if __name__ == '__main__':
             else:
                 video_file = test_sample_videos.get('DVS')[sample]
 
-            frames = preload_video(video_file)
-
-            if vid_nr >= 3:
-                for index in range(len(frames)):
-                    frames[index] = cv2.flip(frames[index], 1)
+            frames = preload_video(video_file, step=4 if use_dvs else 1, flip=vid_nr >= 3)
             fixed_render(frames, dummy_subject, use_dvs)
 
             if not use_dvs:
@@ -471,11 +465,12 @@ if __name__ == '__main__':
 
     for vid_nr in range(subject_progress, 16):
         video_file = order[vid_nr]
-        frames = preload_video(video_file)
+        use_dvs = order[vid_nr].__contains__('DVS')
+        frames = preload_video(video_file, step=4 if use_dvs else 1)
         if CONTROL == 'adaptive':
             adaptive_render(frames, subject)
         elif CONTROL == 'fixed':
-            fixed_render(frames, subject, order[vid_nr].__contains__('DVS'))
+            fixed_render(frames, subject, use_dvs)
 
         # Save subject to JSON
         save_subject_data(base=f".\\results\\subjectdata\\{CONTROL}\\",
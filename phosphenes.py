@@ -0,0 +1,98 @@
+"""
+In this script the phosphene simulator is written, with the same interface as imgproc.PhospheneSimulator of the
+original pipeline. The phosphene grid and kernel are made once. Every frame is then one dilation to find the active
+phosphenes and one separable Gaussian convolution of their impulses, the amount of active phosphenes comes with it.
+"""
+
+import cv2
+import numpy as np
+
+
+class PhospheneSimulator:
+    def __init__(self, intensity: float = 10, phosphene_resolution: tuple = (50, 50), size: tuple = (480, 480),
+                 jitter: float = 0.35, intensity_var: float = 0.9, aperture: float = 0.66, sigma: float = 0.25,
+                 dtype=np.float64, seed: int = 0):
+        """
+        Gaussian phosphenes on a jittered regular grid, a phosphene lights up if an edge falls within its aperture.
+        :param intensity: Stimulation intensity, a fully active phosphene peaks at intensity * 25.5 (10 is white).
+        :param phosphene_resolution: (columns, rows) of phosphenes
+        :param size: (width, height) of the input and output frames
+        :param jitter: Random displacement of every phosphene, relative to the phosphene spacing.
+        :param intensity_var: Random variation of the brightness of every phosphene.
+        :param aperture: Size of the square a phosphene reacts to, relative to the phosphene spacing.
+        :param sigma: Sigma of a phosphene, relative to the phosphene spacing.
+        :param dtype: np.float64 or np.float32, float32 is faster and the difference doesn't show after rounding.
+        :param seed: Seed of the jitter and brightness variation, so every subject sees the same phosphenes.
+        """
+        self.intensity = intensity
+        self.phosphene_resolution = phosphene_resolution
+        self.size = size
+        self.dtype = dtype
+        self.phosphene_spacing = np.divide(size, phosphene_resolution)
+
+        # Phosphene centres, (column, row) pairs in the same order as a phosphene_resolution grid read row by row.
+        generator = np.random.default_rng(seed)
+        columns, rows = np.meshgrid(
+            np.arange(phosphene_resolution[0]) * self.phosphene_spacing[0] + self.phosphene_spacing[0] / 2,
+            np.arange(phosphene_resolution[1]) * self.phosphene_spacing[1] + self.phosphene_spacing[1] / 2)
+        deviation = jitter * (2 * generator.random((2, columns.size)) - 1) * self.phosphene_spacing[:, None]
+        self.columns = np.clip(np.round(columns.ravel() + deviation[0]), 0, size[0] - 1).astype(np.intp)
+        self.rows = np.clip(np.round(rows.ravel() + deviation[1]), 0, size[1] - 1).astype(np.intp)
+        self.brightness = (intensity_var * (generator.random(columns.size) - 0.5) + 1).astype(dtype)
+
+        aperture = max(1, int(np.round(aperture * self.phosphene_spacing[0])))
+        self.dilation_kernel = np.ones((aperture, aperture), np.uint8)
+
+        # Kernel size is fixed here so the peak of the (normalised) blur kernel is known and can be divided out.
+        self.sigma = sigma * self.phosphene_spacing[0]
+        self.kernel_size = int(np.round(self.sigma * 8 + 1)) | 1
+        kernel = cv2.getGaussianKernel(self.kernel_size, self.sigma)
+        self.gain = intensity * 25.5 / 255 / kernel.max() ** 2  # Edge maps are 0-255, a phosphene peaks at 25.5.
+        self.flat_index = self.rows * size[0] + self.columns
+        self.active = 0
+
+    def activation(self, frame):
+        """
+        :param frame: uint8 edge map (height, width), or a batch (frames, height, width).
+        :return: Activation of every phosphene (0-255), shape (phosphenes,) or (frames, phosphenes).
+        """
+        if frame.ndim == 2:
+            return cv2.dilate(frame, self.dilation_kernel)[self.rows, self.columns]
+        # OpenCV filters every channel separately, so the batch goes through as one multi-channel image.
+        dilated = cv2.dilate(np.ascontiguousarray(frame.transpose(1, 2, 0)), self.dilation_kernel)
+        return dilated.reshape(-1, frame.shape[0])[self.flat_index].T
+
+    def render(self, activation):
+        """
+        Draws the phosphenes, every phosphene is an impulse at its centre which the blur turns into a Gaussian.
+        :param activation: Output of activation()
+        :return: uint8 phosphene image (height, width), or a batch (frames, height, width).
+        """
+        batch = activation.ndim == 2
+        activation = np.atleast_2d(activation)
+        pixels = self.size[0] * self.size[1]
+        # bincount instead of indexing, with jitter two phosphenes can end up on the same pixel.
+        index = (self.flat_index + pixels * np.arange(len(activation))[:, None]).ravel()
+        weights = (activation * self.brightness).ravel()
+        impulses = np.bincount(index, weights=weights, minlength=pixels * len(activation))
+        impulses = impulses.astype(self.dtype).reshape(len(activation), self.size[1], self.size[0])
+        impulses = np.ascontiguousarray(impulses.transpose(1, 2, 0))
+        phosphenes = cv2.GaussianBlur(impulses, (self.kernel_size, self.kernel_size), self.sigma)
+        # Scales, rounds and saturates to uint8 in one pass.
+        phosphenes = cv2.convertScaleAbs(phosphenes, alpha=self.gain).reshape(self.size[1], self.size[0], -1)
+        return phosphenes.transpose(2, 0, 1) if batch else phosphenes[:, :, 0]
+
+    def __call__(self, frame):
+        """
+        :param frame: uint8 edge map at 'size' (height, width), or a batch (frames, height, width).
+        :return: uint8 phosphene image of the same shape.
+        """
+        activation = self.activation(frame)
+        self.active = np.count_nonzero(activation, axis=-1)
+        return self.render(activation)
+
+    def count_phosphenes(self):
+        """
+        :return: Amount of active phosphenes in the last frame (or every frame of the last batch).
+        """
+        return self.active if np.ndim(self.active) else int(self.active)
@@ -0,0 +1,142 @@
+"""
+In this script the image processing shared by the pipelines, the edge cache and offline tools is written.
+"""
+
+import os
+import cv2
+import numpy as np
+
+FALLBACK_CANNY_PARAMS = (140, 1.5)  # threshold, sigma of videos without fixed parameters, as in the original pipeline.
+
+
+def find_videos(path: str):
+    """
+    :param path: Directory with the videos, for example .\\Dataset\\Original Videos
+    :return: Sorted list of paths to all stim and sample videos.
+    """
+    return [os.path.join(path, filename) for filename in sorted(os.listdir(path)) if
+            'stim' in filename or 'sample' in filename]
+
+
+def fixed_params(fixed_canny_params: dict, video: str):
+    """
+    Looks up the Canny parameters of a video for the fixed condition.
+    :param fixed_canny_params: Per video name (threshold, sigma), see .\\resource\\fixed_canny_params.json
+    :param video: Path to a video file
+    :return: threshold, sigma and whether FALLBACK_CANNY_PARAMS had to be used.
+    """
+    params = fixed_canny_params.get(os.path.basename(video.replace('\\', '/')))
+    if params is None:
+        return FALLBACK_CANNY_PARAMS[0], FALLBACK_CANNY_PARAMS[1], True
+    return params[0], params[1], False
+
+
+def canny_filter(frame, sigma: float, threshold: float, size: tuple = None, profiler=None, working_width: int = None):
+    """
+    Gaussian blur (to remove noise), Canny edge detection and resize to the stimulus size.
+    This is the exact chain used by fixed_render and adaptive_render.
+    :param frame: BGR or grayscale video frame
+    :param sigma: Sigma of the gaussian blur
+    :param threshold: High threshold of Canny, the low threshold is half of this.
+    :param size: (width, height) to resize to, None keeps the source resolution.
+    :param profiler: Optional profiler.FrameProfiler, the blur, canny and resize stages are marked on it.
+    :param working_width: Downsample wider frames to this width first, sigma stays in source pixels. Much cheaper,
+        check with validation.py which width still gives the same phosphenes as the full resolution.
+    :return: Single channel uint8 edge map
+    """
+    if working_width is not None and frame.shape[1] > working_width:
+        scale = working_width / frame.shape[1]
+        frame = cv2.resize(frame, (working_width, max(1, round(frame.shape[0] * scale))),
+                           interpolation=cv2.INTER_AREA)
+        sigma = sigma * scale
+        if profiler is not None:
+            profiler.mark('downsample')
+    frame = cv2.GaussianBlur(frame, (0, 0), sigma)
+    if profiler is not None:
+        profiler.mark('blur')
+    frame = cv2.Canny(frame, threshold // 2, threshold)
+    if profiler is not None:
+        profiler.mark('canny')
+    if size is not None:
+        frame = cv2.resize(frame, size)
+        if profiler is not None:
+            profiler.mark('resize')
+    return frame
+
+
+class BlurPyramid:
+    def __init__(self, size: tuple, max_sigma: float, sigma_step: float = 0.25, interpolate: bool = False):
+        """
+        Cheaper replacement of the blur in canny_filter for when sigma changes from frame to frame.
+        Each frame is converted to grayscale and downsampled to the stimulus size before anything else, so the cost
+        doesn't depend on the source resolution anymore. Blurred versions at fixed sigma steps are built lazily,
+        every step from the closest smaller one (blurs add up as sqrt(a^2 + b^2)), so asking for several sigmas of
+        the same frame shares the work.
+        Sigma is always given in source pixels, like in canny_filter, and converted to stimulus pixels.
+        :param size: (width, height) of the stimulus
+        :param max_sigma: Highest sigma that can be asked for.
+        :param sigma_step: Distance between two blur levels.
+        :param interpolate: Blend the two closest levels instead of using the nearest one.
+        """
+        self.size = size
+        self.sigma_step = sigma_step
+        self.interpolate = interpolate
+        self.sigmas = [sigma_step * level for level in range(int(np.ceil(max_sigma / sigma_step)) + 1)]
+        self.scale = (1, 1)
+        self._levels = []
+
+    def load(self, frame):
+        """
+        Converts a new frame to grayscale at stimulus size and throws away the blur levels of the previous frame.
+        :param frame: BGR or grayscale video frame
+        """
+        if frame.ndim == 3:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        self.scale = (self.size[0] / frame.shape[1], self.size[1] / frame.shape[0])
+        self._levels = [cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)] + [None] * (len(self.sigmas) - 1)
+
+    def quantize(self, sigma: float):
+        """
+        :return: The sigma that is actually used, only differs from 'sigma' if interpolate is off.
+        """
+        if self.interpolate:
+            return min(max(sigma, 0), self.sigmas[-1])
+        return self.sigmas[self._nearest(sigma)]
+
+    def level(self, index: int):
+        """
+        :return: The loaded frame blurred with sigma self.sigmas[index].
+        """
+        if self._levels[index] is None:
+            base = max(i for i in range(index) if self._levels[i] is not None)
+            extra = np.sqrt(self.sigmas[index] ** 2 - self.sigmas[base] ** 2)
+            self._levels[index] = cv2.GaussianBlur(self._levels[base], (0, 0), sigmaX=extra * self.scale[0],
+                                                   sigmaY=extra * self.scale[1])
+        return self._levels[index]
+
+    def blur(self, sigma: float):
+        """
+        :param sigma: Sigma in source pixels
+        :return: The loaded frame, blurred and at stimulus size.
+        """
+        if not self.interpolate:
+            return self.level(self._nearest(sigma))
+        position = min(max(sigma, 0), self.sigmas[-1]) / self.sigma_step
+        lower = int(np.floor(position))
+        weight = position - lower
+        if weight == 0 or lower + 1 >= len(self.sigmas):
+            return self.level(min(lower, len(self.sigmas) - 1))
+        return cv2.addWeighted(self.level(lower), 1 - weight, self.level(lower + 1), weight, 0)
+
+    def canny(self, sigma: float, threshold: float):
+        """
+        Approximates canny_filter(frame, sigma, threshold, size), but Canny runs at stimulus size so the edges are
+        one stimulus pixel wide instead of resized.
+        :param sigma: Sigma in source pixels
+        :param threshold: High threshold of Canny, the low threshold is half of this.
+        :return: Single channel uint8 edge map
+        """
+        return cv2.Canny(self.blur(sigma), threshold // 2, threshold)
+
+    def _nearest(self, sigma: float):
+        return min(max(int(round(sigma / self.sigma_step)), 0), len(self.sigmas) - 1)
@@ -0,0 +1,178 @@
+"""
+In this script the timing instrumentation of the render loop is written. Every stage of a frame (event pump, blur,
+Canny, resize, surface conversion, blit, flip and tick sleep) is timed with time.perf_counter_ns and kept in a
+histogram, together with the time between frames so dropped frames can be counted against the framerate.
+Stages that run on the worker thread of a renderpipeline.RenderPipeline are timed there with a StageTimer and handed
+back with every frame, they are kept apart because they overlap with the stages of the pygame thread.
+"""
+
+import time
+
+
+class LatencyHistogram:
+    def __init__(self, sub_bucket_bits: int = 7):
+        """
+        HDR style histogram of nanosecond values. Values are grouped per power of two and within that in
+        2^sub_bucket_bits linear buckets, so every value is kept with a relative error below 2^-(sub_bucket_bits-1)
+        no matter if it is a microsecond or a second, in a few hundred counters at most.
+        :param sub_bucket_bits: Precision, 7 gives an error below 1.6%.
+        """
+        self.sub_bucket_bits = sub_bucket_bits
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def record(self, value: int):
+        """
+        :param value: Duration in nanoseconds
+        """
+        shift = max(0, value.bit_length() - self.sub_bucket_bits)
+        key = (shift, value >> shift)
+        self.counts[key] = self.counts.get(key, 0) + 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, percentile: float):
+        """
+        :param percentile: 0-100
+        :return: Value in nanoseconds (middle of the bucket) below which 'percentile' percent of the values fall.
+        """
+        if self.count == 0:
+            return None
+        target = percentile / 100 * self.count
+        seen = 0
+        for shift, sub_bucket in sorted(self.counts, key=lambda key: key[1] << key[0]):
+            seen += self.counts[(shift, sub_bucket)]
+            if seen >= target:
+                return min(max((sub_bucket << shift) + ((1 << shift) >> 1), self.min), self.max)
+        return self.max
+
+    def summary(self):
+        """
+        :return: Dictionary with count, min, mean, max and percentiles in milliseconds.
+        """
+        if self.count == 0:
+            return {'count': 0}
+        summary = {'count': self.count, 'min_ms': self.min / 1e6, 'mean_ms': self.total / self.count / 1e6,
+                   'max_ms': self.max / 1e6}
+        for percentile in (50, 90, 95, 99, 99.9):
+            summary[f'p{percentile:g}_ms'] = self.percentile(percentile) / 1e6
+        # Buckets are kept so histograms of several subjects can be merged later on.
+        summary['buckets'] = {f'{sub_bucket << shift}': count for (shift, sub_bucket), count in
+                              sorted(self.counts.items(), key=lambda item: item[0][1] << item[0][0])}
+        return summary
+
+
+class StageTimer:
+    def __init__(self):
+        """
+        Times stages like FrameProfiler.mark, but only collects the durations so they can be handed to another thread.
+        """
+        self.durations = []
+        self._last = None
+
+    def restart(self):
+        """
+        Call right before the first stage.
+        """
+        self._last = time.perf_counter_ns()
+
+    def mark(self, stage: str):
+        """
+        Records the time since the previous mark (or restart) as the duration of 'stage'.
+        :param stage: Name of the stage that just finished
+        """
+        now = time.perf_counter_ns()
+        self.durations.append((stage, now - self._last))
+        self._last = now
+
+    def take(self):
+        """
+        :return: List of (stage, nanoseconds) marked since the previous take, the list is emptied.
+        """
+        durations = self.durations
+        self.durations = []
+        return durations
+
+
+class FrameProfiler:
+    def __init__(self, framerate: int, late_tolerance: float = 1.5):
+        """
+        Times the stages of every frame. Call mark(stage) after each stage and end_frame() after fps_clock.tick().
+        The time of a stage is the time since the previous mark, so stages must be marked in order.
+        :param framerate: Framerate the video should be played at.
+        :param late_tolerance: A frame counts as dropped if it took longer than this many frame periods.
+        """
+        self.framerate = framerate
+        self.frame_period = 1e9 / framerate
+        self.late_tolerance = late_tolerance
+        self.stages = {}
+        self.worker_stages = {}
+        self.frames = LatencyHistogram()
+        self.dropped_frames = 0
+        self.shown_frames = 0
+        self.playing_time = 0
+        self._last = None
+        self._last_frame_end = None
+
+    def restart(self):
+        """
+        Call after a pause in playback (countdown, loop transition) so the pause isn't measured as a slow frame.
+        """
+        self._last = time.perf_counter_ns()
+        self._last_frame_end = None
+
+    def mark(self, stage: str):
+        """
+        Records the time since the previous mark as the duration of 'stage'.
+        :param stage: Name of the stage that just finished
+        """
+        now = time.perf_counter_ns()
+        if self._last is not None:
+            if stage not in self.stages:
+                self.stages[stage] = LatencyHistogram()
+            self.stages[stage].record(now - self._last)
+        self._last = now
+
+    def add_worker_stages(self, durations: list):
+        """
+        Records stages that ran on the worker thread of a RenderPipeline.
+        :param durations: StageTimer.take() of one frame
+        """
+        for stage, duration in durations:
+            if stage not in self.worker_stages:
+                self.worker_stages[stage] = LatencyHistogram()
+            self.worker_stages[stage].record(duration)
+
+    def end_frame(self, stage: str = 'tick sleep'):
+        """
+        Marks the last stage of a frame and records the time between this frame and the previous one.
+        :param stage: Name of the last stage, normally the sleep in fps_clock.tick.
+        """
+        self.mark(stage)
+        self.shown_frames += 1
+        if self._last_frame_end is not None:
+            interval = self._last - self._last_frame_end
+            self.frames.record(interval)
+            self.playing_time += interval
+            if interval > self.frame_period * self.late_tolerance:
+                self.dropped_frames += 1
+        self._last_frame_end = self._last
+
+    def summary(self):
+        """
+        :return: Dictionary that can be saved to JSON with the frame intervals, dropped frames and all stages. Stages
+            of the pygame thread add up to the frame interval, 'worker_stages' ran at the same time on the worker.
+        """
+        measured = self.frames.count
+        return {'framerate': self.framerate,
+                'shown_frames': self.shown_frames,
+                'dropped_frames': self.dropped_frames,
+                'achieved_framerate': measured / (self.playing_time / 1e9) if self.playing_time else None,
+                'frame_interval': self.frames.summary(),
+                'stages': {stage: histogram.summary() for stage, histogram in self.stages.items()},
+                'worker_stages': {stage: histogram.summary() for stage, histogram in self.worker_stages.items()}}
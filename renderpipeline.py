@@ -0,0 +1,104 @@
+"""
+In this script the threaded render pipeline is written. A worker thread does the image processing (blur, Canny,
+resize) of the next frames while the pygame thread blits, flips and waits for the next tick of the previous one.
+OpenCV releases the GIL, so both actually run at the same time on a multi-core machine.
+"""
+
+import queue
+import threading
+import profiler
+
+_STOP = object()  # Ticket telling the worker to stop.
+
+
+class RenderPipeline:
+    def __init__(self, frame_source, process, params=None, depth: int = 2, frame_profiler=None):
+        """
+        Processes the frames of 'frame_source' on a worker thread, at most 'depth' frames ahead of the display.
+        Every frame is processed with the parameters of a ticket. A ticket is handed in by request(params), or
+        with the latest parameters when the next frame is taken without a request.
+        With depth=1 and request() called right after reading the mouse, parameters read during frame N are shown
+        at frame N + 1, that's at most one frame of latency.
+        Iterating over this object gives one pass over frame_source, like framesource.FrameStream.
+        :param frame_source: framesource.FrameStream, edgecache.EdgeFrames or any iterable of frames
+        :param process: Function process(frame_index, frame, params, stage_timer) returning the frame to show. The
+            stages it marks on stage_timer (a profiler.StageTimer, None without frame_profiler) are timed on the worker.
+        :param params: Parameters used until request() gives newer ones.
+        :param depth: Amount of frames processed ahead of the display.
+        :param frame_profiler: profiler.FrameProfiler of the pygame thread, the worker stages of every frame are added
+            to it when that frame is taken.
+        """
+        self.frame_source = frame_source
+        self.process = process
+        self.params = params
+        self.depth = depth
+        self.frame_profiler = frame_profiler
+        self._tickets = None
+        self._requested = False
+
+    def __len__(self):
+        return len(self.frame_source)
+
+    def request(self, params):
+        """
+        Hands in the ticket for the next frame to process, call this at most once per shown frame.
+        :param params: Parameters to process that frame with.
+        """
+        self.params = params
+        if not self._requested:
+            self._tickets.put(params)
+            self._requested = True
+
+    def __iter__(self):
+        self._tickets = queue.Queue()
+        results = queue.Queue()
+        worker = threading.Thread(target=self._work, args=(self._tickets, results), daemon=True)
+        for _ in range(self.depth):
+            self._tickets.put(self.params)
+        worker.start()
+        try:
+            while True:
+                self._requested = False
+                result = results.get()
+                if result is None:  # End of pass
+                    break
+                if isinstance(result, BaseException):
+                    raise result
+                frame, durations = result
+                if self.frame_profiler is not None:
+                    self.frame_profiler.add_worker_stages(durations)
+                yield frame
+                if not self._requested:
+                    self._tickets.put(self.params)
+        finally:
+            # Also reached when the loop over this pass is broken off (spacebar).
+            self._tickets.put(_STOP)
+            worker.join()
+
+    def close(self):
+        """
+        Closes the frame source.
+        """
+        self.frame_source.close()
+
+    def _work(self, tickets: queue.Queue, results: queue.Queue):
+        """
+        Worker thread, processes one frame for every ticket and puts None in results at the end of the pass.
+        Every result is (frame, stage durations).
+        """
+        stage_timer = profiler.StageTimer() if self.frame_profiler is not None else None
+        try:
+            for frame_index, frame in enumerate(self.frame_source):
+                params = tickets.get()
+                if params is _STOP:
+                    return
+                if stage_timer is None:
+                    results.put((self.process(frame_index, frame, params, None), []))
+                    continue
+                stage_timer.restart()
+                frame = self.process(frame_index, frame, params, stage_timer)
+                results.put((frame, stage_timer.take()))
+        except Exception as exception:  # Shown on the pygame thread instead of killing the worker silently.
+            results.put(exception)
+            return
+        results.put(None)
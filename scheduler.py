@@ -0,0 +1,64 @@
+"""
+In this script the frame scheduler is written. fps_clock.tick() and time.sleep() wait relative to the previous frame,
+so every late frame makes the whole video a bit longer. Here every frame has a fixed presentation deadline counted
+from the start of the video, frames that are too late are skipped so playback catches up again.
+"""
+
+import time
+
+
+class FrameScheduler:
+    def __init__(self, framerate: float, spin_time: float = 0.001, late_tolerance: float = 0.002):
+        """
+        :param framerate: Frames per second
+        :param spin_time: The last part of every wait is a busy loop instead of time.sleep, which can oversleep.
+        :param late_tolerance: Seconds past its deadline a frame may be without counting as late.
+        """
+        self.framerate = framerate
+        self.spin_time = spin_time
+        self.late_tolerance = late_tolerance
+        self.start_time = None
+        self.slot = 0
+        self.late_frames = 0
+        self.skipped_frames = 0
+
+    def start(self):
+        """
+        Starts the schedule, slot 0 is now. Call again after a pause (loop transition) to start a new schedule.
+        """
+        self.start_time = time.perf_counter()
+        self.slot = 0
+
+    def deadline(self, slot: int):
+        """
+        :return: time.perf_counter() value at which 'slot' should be shown.
+        """
+        return self.start_time + slot / self.framerate
+
+    def wait(self):
+        """
+        Waits until the deadline of the next slot. If that deadline had already passed by more than a whole frame,
+        the slots in between are skipped.
+        :return: The slot that is due now, frames with a lower index should not be shown anymore.
+        """
+        self.slot += 1
+        target = self.deadline(self.slot)
+        remaining = target - time.perf_counter()
+        if remaining < -self.late_tolerance:
+            self.late_frames += 1
+        if remaining > self.spin_time:
+            time.sleep(remaining - self.spin_time)
+        while time.perf_counter() < target:
+            pass
+
+        due = int((time.perf_counter() - self.start_time) * self.framerate)
+        if due > self.slot:
+            self.skipped_frames += due - self.slot
+            self.slot = due
+        return self.slot
+
+    def summary(self):
+        """
+        :return: Dictionary that can be saved to JSON with the amount of late and skipped frames.
+        """
+        return {'framerate': self.framerate, 'late_frames': self.late_frames, 'skipped_frames': self.skipped_frames}
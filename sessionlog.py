@@ -0,0 +1,203 @@
+"""
+In this script the session log of a subject is written. Instead of writing the whole subject (every frame of every
+earlier video included) to JSON after each video, one line per video is appended to a JSON Lines file and synced
+to disk. A crash can at most cut off the last line, which is skipped when reading and removed before the next append.
+
+Run this script to merge the session logs (and subject files saved as JSON before the log existed) into the
+combined_{CONTROL}.json file used by analyse.py. Subjects are read in parallel and written one at a time, subjects
+whose file didn't change since the last merge are copied from the previous combined file without reading them.
+"""
+
+import glob
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import fileutil
+import objects
+
+
+class SessionLog:
+    def __init__(self, path: str):
+        """
+        :param path: JSON Lines file, created if it doesn't exist yet.
+        """
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        if os.path.exists(path):
+            with open(path, 'rb+') as file:
+                content = file.read()
+                if content and not content.endswith(b'\n'):  # Cut off by a crash, the next record starts clean.
+                    file.truncate(content.rfind(b'\n') + 1)
+
+    def append(self, record: dict):
+        """
+        Appends one record and syncs it to disk before returning.
+        :param record: Dictionary that can be saved to JSON
+        """
+        with open(self.path, 'a') as file:
+            file.write(json.dumps(record, separators=(',', ':')) + '\n')
+            file.flush()
+            os.fsync(file.fileno())
+
+    def start(self, subject: objects.Subject):
+        """
+        Logs the start (or resume) of a session with the video order of the subject.
+        """
+        self.append({'type': 'session', 'subject_id': subject.get_subject_id(), 'order': subject.get_vidorder()})
+
+    def trial(self, subject: objects.Subject, video: str):
+        """
+        Logs the answers and the frame log of one video.
+        :param video: Path of the video, the key of the answers and actions of the subject.
+        """
+        self.append({'type': 'trial', 'video': video, 'answers': subject.get_answers().get(video),
+                     'actions': subject.get_data()[2].get(video)})
+
+
+def read(path: str):
+    """
+    Replays a session log.
+    :param path: JSON Lines file written by SessionLog
+    :return: Subject object, None if the log doesn't exist.
+    """
+    if not os.path.exists(path):
+        return None
+    subject = objects.Subject(subject_id='', order=[], answers={}, actions={})
+    with open(path, 'r') as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except json.decoder.JSONDecodeError:  # Cut off by a crash while writing, only the last line can be.
+                print(f"WARNING: skipped an incomplete record in {path}")
+                continue
+            if record['type'] == 'session':
+                subject.subject_id = record['subject_id']
+                subject.set_order(record['order'])
+            elif record['type'] == 'trial':
+                if record['answers'] is not None:
+                    subject.answers[record['video']] = record['answers']
+                subject.update_actions(record['video'], record['actions'])
+    return subject
+
+
+def read_json(path: str):
+    """
+    Reads a subject saved as one JSON file, like the pipelines did before the session log.
+    :param path: subject_{id}_{CONTROL}.json
+    :return: Subject object, None if the file doesn't exist or isn't valid JSON.
+    """
+    try:
+        with open(path, 'r') as file:
+            info = json.load(file)
+    except (FileNotFoundError, json.decoder.JSONDecodeError):
+        return None
+    return objects.Subject(subject_id=info['subject_id'], order=info['order'], answers=info['answers'],
+                           actions=info['actions'])
+
+
+def subject_files(log_dir: str, control: str):
+    """
+    :param log_dir: Directory with the subject data of one condition
+    :param control: 'adaptive' or 'fixed'
+    :return: Sorted paths of every subject, the session log if a subject has one, otherwise its JSON file.
+    """
+    logs = glob.glob(os.path.join(log_dir, f'subject_*_{control}.jsonl'))
+    saved = [path for path in glob.glob(os.path.join(log_dir, f'subject_*_{control}.json')) if path + 'l' not in logs]
+    return sorted(logs + saved)
+
+
+def encode_subject(path: str):
+    """
+    Reads one subject file, runs in the worker processes of compact().
+    :param path: Session log or subject JSON file
+    :return: The subject as JSON (bytes), its subject id and its amount of answers, (None, '', 0) if it couldn't be
+        read.
+    """
+    subject = read(path) if path.endswith('.jsonl') else read_json(path)
+    if subject is None:
+        return None, '', 0
+    return json.dumps(subject.get_object_as_dict()).encode(), subject.get_subject_id(), len(subject.get_answers())
+
+
+def compact(paths: list, output: str, min_answers: int = 0, workers: int = None):
+    """
+    Writes the subjects of several session logs to one JSON file, in the combined_{CONTROL}.json format:
+    {"10": {"subject_id": "10", "answers": ..., "actions": ..., "order": ...}, "11": ...}
+    Subjects are keyed by their subject id, analyse.py uses it as the subject, so ids must be unique across conditions.
+    Files are read in a process pool and written one at a time in order, only a few subjects are in memory at once.
+    The size, modification time and byte range in 'output' of every file are kept in output + '.merge.json'. On the
+    next merge unchanged subjects are copied from the previous 'output' as bytes instead of being read again.
+    :param paths: Session logs (or subject JSON files), written in this order.
+    :param output: JSON file to write
+    :param min_answers: Subjects with fewer answers are left out (analyse.py only uses subjects with 16).
+    :param workers: Amount of processes, None uses one per CPU.
+    :return: Amount of subjects written and amount of files that were read again.
+    """
+    manifest_path = output + '.merge.json'
+    previous = {}
+    if os.path.exists(manifest_path) and os.path.exists(output):
+        with open(manifest_path, 'r') as file:
+            manifest = json.load(file)
+        if manifest['min_answers'] == min_answers:
+            previous = manifest['files']
+
+    files = {}
+    for path in paths:
+        stat = os.stat(path)
+        files[path] = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'subject_id': '', 'answers': 0,
+                       'offset': None, 'length': 0}
+    reused = {path for path, info in files.items() if path in previous and 'subject_id' in previous[path] and
+              (previous[path]['size'], previous[path]['mtime']) == (info['size'], info['mtime'])}
+
+    written = set()
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(workers) as pool, fileutil.atomic_write(output) as file, \
+            open(output if reused else os.devnull, 'rb') as old:
+
+        def write(path, future):
+            if future is None:
+                data = None
+                subject_id, answers = previous[path]['subject_id'], previous[path]['answers']
+                if previous[path]['offset'] is not None:  # Unchanged subjects that were left out stay left out.
+                    old.seek(previous[path]['offset'])
+                    data = old.read(previous[path]['length'])
+            else:
+                data, subject_id, answers = future.result()
+            files[path]['subject_id'], files[path]['answers'] = subject_id, answers
+            if data is None or answers < min_answers:
+                print(f"WARNING: left out {path}, {answers}/{min_answers} answers")
+                return
+            if not subject_id:
+                raise ValueError(f"{path} has no subject id")
+            if subject_id in written:
+                raise ValueError(f"Subject id {subject_id} of {path} is used by another subject file")
+            file.write(f'{", " if written else ""}{json.dumps(subject_id)}: '.encode())
+            files[path]['offset'], files[path]['length'] = file.tell(), len(data)
+            file.write(data)
+            written.add(subject_id)
+
+        file.write(b'{')
+        window = deque()  # Subjects in order, read ahead by the pool but written one at a time.
+        for path in paths:
+            window.append((path, None if path in reused else pool.submit(encode_subject, path)))
+            if len(window) > 4 * workers:
+                write(*window.popleft())
+        while window:
+            write(*window.popleft())
+        file.write(b'}')
+
+    with fileutil.atomic_write(manifest_path, 'w') as file:
+        json.dump({'min_answers': min_answers, 'files': files}, file)
+    return len(written), len(paths) - len(reused)
+
+
+if __name__ == '__main__':
+    # -PARAMETERS- #
+    CONTROL = 'adaptive'  # choose from ['adaptive', 'fixed']
+    LOG_DIR = f'.\\results\\subjectdata\\{CONTROL}\\'
+    MIN_ANSWERS = 16  # Only finished subjects are combined.
+
+    subjects = subject_files(LOG_DIR, CONTROL)
+    written, merged = compact(subjects, os.path.join(LOG_DIR, f'combined_{CONTROL}.json'), MIN_ANSWERS)
+    print(f"{written} of {len(subjects)} subjects written to combined_{CONTROL}.json, {merged} files read again")
@@ -0,0 +1,96 @@
+"""
+In this script the stage cache of analyse.py is written. The result of every analysis stage (a pandas dataframe) is
+saved as .npz with one array per column, under a key that hashes everything the stage depends on: the content of the
+subject JSON files and the parameters used (ANSWERS, MODES, CUTOFF). A stage is only computed again when its key
+changes, so changing CUTOFF only redoes the learning curve aggregation.
+"""
+
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+import fileutil
+
+
+def stage_key(stage: str, *inputs):
+    """
+    :param stage: Name of the stage
+    :param inputs: Everything the stage depends on, content hashes, keys of earlier stages and parameters. Must be
+        JSON serializable (tuples are saved as lists).
+    :return: sha1 hex digest
+    """
+    return hashlib.sha1(json.dumps([stage, *inputs], sort_keys=True).encode()).hexdigest()
+
+
+class StageCache:
+    def __init__(self, cache_dir: str = None):
+        """
+        :param cache_dir: Directory the stages are saved in, created if it doesn't exist yet. None disables caching,
+            get() then always computes the stage.
+        """
+        self.cache_dir = cache_dir
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def get(self, stage: str, key: str, compute):
+        """
+        Loads a stage, computing and saving it first if it wasn't saved with this key.
+        :param stage: Name of the stage
+        :param key: stage_key() of its inputs
+        :param compute: Function without arguments returning the dataframe of the stage.
+        :return: pandas dataframe
+        """
+        if self.cache_dir is None:
+            return compute()
+        dataframe = self.load(stage, key)
+        if dataframe is None:
+            dataframe = compute()
+            self.save(stage, key, dataframe)
+        return dataframe
+
+    def path(self, stage: str, key: str):
+        """
+        :return: Path of the cache file belonging to this stage and key.
+        """
+        return os.path.join(self.cache_dir, f"{stage}_{key[:16]}.npz")
+
+    def load(self, stage: str, key: str):
+        """
+        :param stage: Name of the stage
+        :param key: stage_key() of its inputs
+        :return: The saved dataframe, None if this stage wasn't saved with this key.
+        """
+        path = self.path(stage, key)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            meta = json.loads(data['meta'].item())
+            columns = {column: data[f'column_{number}'] for number, column in enumerate(meta['columns'])}
+        # Strings are saved as fixed width unicode, pandas keeps them as objects.
+        dataframe = pd.DataFrame({column: values.astype(object) if values.dtype.kind == 'U' else values
+                                  for column, values in columns.items()})
+        if meta['index']:
+            dataframe = dataframe.set_index(meta['index'])
+        return dataframe
+
+    def save(self, stage: str, key: str, dataframe: pd.DataFrame):
+        """
+        Saves a dataframe, every column as one array. Object columns must hold strings.
+        :param stage: Name of the stage
+        :param key: stage_key() of its inputs
+        :param dataframe: Result of the stage
+        """
+        index = []
+        if not dataframe.index.equals(pd.RangeIndex(len(dataframe))):  # A default index is rebuilt on load.
+            levels = dataframe.index.nlevels
+            dataframe = dataframe.reset_index()
+            index = list(dataframe.columns[:levels])
+        columns = {}
+        for number, column in enumerate(dataframe.columns):
+            values = dataframe[column].to_numpy()
+            columns[f'column_{number}'] = values.astype(str) if values.dtype == object else values
+        meta = json.dumps({'columns': list(dataframe.columns), 'index': index})
+        path = self.path(stage, key)
+        with fileutil.atomic_write(path) as file:
+            np.savez(file, meta=np.array(meta), **columns)
@@ -0,0 +1,158 @@
+"""
+In this script the streaming reader of the combined_{CONTROL}.json files is written. Instead of json.load on the
+whole file, the members of the top level object ({"0": subject, "1": subject, ...}) are decoded one at a time, so
+only one subject is in memory at once. The first read writes a small sidecar index next to the file with the byte
+range of every subject and the only parts analyse.py needs: the answers and the 'pre-start' data of every video.
+Later reads only open the index, the per-frame actions of a subject are read from the file when asked for.
+Per-frame actions saved as .npz (recorder.py) are read back from next to the combined file.
+"""
+
+import json
+import os
+import fileutil
+import objects
+import recorder
+
+DECODER = json.JSONDecoder()
+WHITESPACE = b' \t\n\r'
+
+
+def iter_members(path: str, chunk_size: int = 1 << 20):
+    """
+    Streams the members of the top level object of a JSON file.
+    The bytes are decoded as latin-1 to find where values end, which keeps positions equal to byte offsets. Values
+    with non-ASCII bytes are decoded again as UTF-8.
+    :param path: JSON file with an object at the top level
+    :param chunk_size: Amount of bytes read at once, a member larger than this reads more.
+    :return: generator of (key, offset, length, value), offset and length in bytes of the value within the file.
+    """
+    with open(path, 'rb') as file:
+        buffer = b''
+        start = 0  # File offset of buffer[0]
+        eof = False
+
+        def read_more():
+            nonlocal buffer, eof
+            chunk = file.read(max(chunk_size, len(buffer)))  # Doubles for large members, reading stays linear.
+            eof = not chunk
+            buffer += chunk
+
+        def skip_whitespace():
+            nonlocal buffer, start
+            while True:
+                stripped = buffer.lstrip(WHITESPACE)
+                start += len(buffer) - len(stripped)
+                buffer = stripped
+                if buffer or eof:
+                    return buffer[:1]
+                read_more()
+
+        def decode():
+            nonlocal buffer, start
+            while True:
+                try:
+                    value, end = DECODER.raw_decode(buffer.decode('latin-1'))
+                    if end < len(buffer) or eof:  # A number at the end of the buffer might continue.
+                        break
+                except json.decoder.JSONDecodeError:
+                    if eof:
+                        raise
+                read_more()
+            raw = buffer[:end]
+            if not raw.isascii():
+                value = json.loads(raw.decode('utf-8'))
+            offset = start
+            buffer = buffer[end:]
+            start += end
+            return value, offset, end
+
+        read_more()
+        if skip_whitespace() != b'{':
+            raise json.decoder.JSONDecodeError("Expecting '{'", buffer.decode('latin-1'), 0)
+        buffer = buffer[1:]
+        start += 1
+        first = True
+        while True:
+            token = skip_whitespace()
+            if token == b'}':
+                return
+            if not first:
+                if token != b',':
+                    raise json.decoder.JSONDecodeError("Expecting ',' delimiter", buffer.decode('latin-1'), 0)
+                buffer = buffer[1:]
+                start += 1
+                skip_whitespace()
+            key, _, _ = decode()
+            if skip_whitespace() != b':':
+                raise json.decoder.JSONDecodeError("Expecting ':' delimiter", buffer.decode('latin-1'), 0)
+            buffer = buffer[1:]
+            start += 1
+            skip_whitespace()
+            value, offset, length = decode()
+            yield key, offset, length, value
+            first = False
+
+
+def build_index(path: str):
+    """
+    Streams a combined file once and keeps what the analysis needs of every subject.
+    :param path: combined_{CONTROL}.json
+    :return: List of {'key', 'offset', 'length', 'subject_id', 'order', 'answers', 'pre-start': {video: ...}}
+    """
+    entries = []
+    for key, offset, length, info in iter_members(path):
+        entries.append({'key': key, 'offset': offset, 'length': length, 'subject_id': info.get('subject_id'),
+                        'order': info.get('order'), 'answers': info.get('answers', {}),
+                        'pre-start': {video: (actions or {}).get('pre-start')
+                                      for video, actions in info.get('actions', {}).items()}})
+    return entries
+
+
+def load_index(path: str):
+    """
+    Returns the sidecar index of a combined file, it is built again when the size or modification time changed.
+    :param path: combined_{CONTROL}.json
+    :return: build_index() of the file
+    """
+    stat = os.stat(path)
+    sidecar = path + '.index.json'
+    if os.path.exists(sidecar):
+        with open(sidecar, 'r') as file:
+            index = json.load(file)
+        if index['size'] == stat.st_size and index['mtime'] == stat.st_mtime_ns:
+            return index['subjects']
+
+    subjects = build_index(path)
+    with fileutil.atomic_write(sidecar, 'w') as file:
+        json.dump({'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'subjects': subjects}, file)
+    return subjects
+
+
+def load_actions(path: str, entry: dict):
+    """
+    Reads the full actions of one subject, only this subject is decoded. Videos recorded as .npz are loaded with
+    recorder.load_actions, so every video comes back in the same format.
+    :param path: combined_{CONTROL}.json
+    :param entry: Entry of load_index(path)
+    :return: {video: {'pre-start': ..., frame: ...}}
+    """
+    with open(path, 'rb') as file:
+        file.seek(entry['offset'])
+        actions = json.loads(file.read(entry['length']).decode('utf-8')).get('actions', {})
+    # Recordings are named relative to the subject data directory, which is where the combined file is written.
+    return {video: recorder.load_actions(video_actions, os.path.dirname(path)) if video_actions else video_actions
+            for video, video_actions in actions.items()}
+
+
+def iter_subjects(path: str, actions: bool = False):
+    """
+    Yields the subjects of a combined file one at a time.
+    :param path: combined_{CONTROL}.json
+    :param actions: Read the full actions of every subject, otherwise only the 'pre-start' data of every video.
+    :return: generator of (key, objects.Subject)
+    """
+    for entry in load_index(path):
+        subject_actions = load_actions(path, entry) if actions else \
+            {video: {'pre-start': pre_start} for video, pre_start in entry['pre-start'].items()}
+        yield entry['key'], objects.Subject(subject_id=entry['subject_id'], order=entry['order'],
+                                            answers=entry['answers'], actions=subject_actions)
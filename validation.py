@@ -0,0 +1,113 @@
+"""
+This script checks the downsample-before-Canny mode of preprocessing.canny_filter (WORKING_WIDTH in
+modified_pipeline.py). Every frame of the stimuli is edge detected at full resolution and at each candidate working
+width, for every frame the phosphenes that light up are compared. The report has the agreement per frame, the cost of
+both paths and the lowest width that keeps (nearly) the same phosphenes active.
+"""
+
+import json
+import os
+import time
+import cv2
+import numpy as np
+import phosphenes
+import preprocessing
+
+
+def compare(video: str, threshold: float, sigma: float, working_widths: list, simulator, max_frames: int = None):
+    """
+    :param video: Path to a video file
+    :param threshold: Canny threshold
+    :param sigma: Gaussian blur sigma
+    :param working_widths: Widths to downsample to before Canny
+    :param simulator: phosphenes.PhospheneSimulator, its size is the stimulus size.
+    :param max_frames: Only compare the first frames, None compares all frames.
+    :return: Dictionary with the full resolution cost and per working width the agreement per frame and cost.
+    """
+    full_ms = []
+    results = {width: {'agreement': [], 'jaccard': [], 'ms': []} for width in working_widths}
+    cap = cv2.VideoCapture(video)
+    _, video_frame = cap.read()
+    while video_frame is not None and (max_frames is None or len(full_ms) < max_frames):
+        start = time.perf_counter()
+        edges = preprocessing.canny_filter(video_frame, sigma=sigma, threshold=threshold, size=simulator.size)
+        full_ms.append((time.perf_counter() - start) * 1000)
+        reference = simulator.activation(edges) > 0
+
+        for width in working_widths:
+            start = time.perf_counter()
+            edges = preprocessing.canny_filter(video_frame, sigma=sigma, threshold=threshold, size=simulator.size,
+                                               working_width=width)
+            results[width]['ms'].append((time.perf_counter() - start) * 1000)
+            active = simulator.activation(edges) > 0
+            results[width]['agreement'].append(float(np.mean(active == reference)))
+            union = np.count_nonzero(active | reference)
+            results[width]['jaccard'].append(np.count_nonzero(active & reference) / union if union else 1.0)
+        _, video_frame = cap.read()
+    resolution = [int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))]
+    cap.release()
+
+    report = {'resolution': resolution,
+              'threshold': threshold, 'sigma': sigma, 'frames': len(full_ms), 'full_ms': float(np.mean(full_ms)),
+              'working_widths': {}}
+    for width, result in results.items():
+        report['working_widths'][width] = {
+            'mean_agreement': float(np.mean(result['agreement'])),
+            'p5_agreement': float(np.percentile(result['agreement'], 5)),
+            'min_agreement': float(np.min(result['agreement'])),
+            'mean_jaccard': float(np.mean(result['jaccard'])),
+            'p5_jaccard': float(np.percentile(result['jaccard'], 5)),
+            'ms': float(np.mean(result['ms'])),
+            'speedup': float(np.mean(full_ms) / np.mean(result['ms'])),
+            'agreement': result['agreement'], 'jaccard': result['jaccard']}
+    return report
+
+
+def lowest_width(reports: dict, target: float):
+    """
+    :param reports: compare() result per video
+    :param target: Jaccard index (overlap of the active phosphenes) that at least 95% of the frames of every video
+        must reach. Used instead of the agreement, which mostly counts phosphenes that are off in both paths.
+    :return: The lowest working width meeting the target, None if none does.
+    """
+    widths = sorted(next(iter(reports.values()))['working_widths'])
+    for width in widths:
+        if all(report['working_widths'][width]['p5_jaccard'] >= target for report in reports.values()):
+            return width
+    return None
+
+
+if __name__ == '__main__':
+    # -PARAMETERS- #
+    DATA_DIR = '.\\Dataset'  # Dataset downloadable at https://osf.io/s2udz (https://doi.org/10.1145/3458709.3458982)
+    SUBFOLDER = 'Original Videos'
+    WORKING_WIDTHS = [320, 480, 640, 960, 1280]  # Candidate widths, wider than the source means no downsampling.
+    MAX_FRAMES = 100  # Frames compared per video, None compares all frames.
+    OVERLAP_TARGET = 0.9  # Jaccard index of the active phosphenes compared to full resolution.
+    PHOSPHENE_RESOLUTION = (50, 50)  # Same as the original pipeline.
+    OUTPUT = '.\\results\\downsample_validation.json'
+    phosphene_imsize = (960, 960)  # Specify size of stimulus
+
+    with open('.\\resource\\fixed_canny_params.json', 'r') as params_file:
+        fixed_canny_params = json.load(params_file)
+    phosphene_simulator = phosphenes.PhospheneSimulator(phosphene_resolution=PHOSPHENE_RESOLUTION,
+                                                        size=phosphene_imsize)
+
+    video_reports = dict()
+    for video_path in preprocessing.find_videos(os.path.join(DATA_DIR, SUBFOLDER)):
+        filename = os.path.basename(video_path)
+        threshold, sigma, _ = preprocessing.fixed_params(fixed_canny_params, video_path)
+        video_reports[filename] = compare(video_path, threshold, sigma, WORKING_WIDTHS, phosphene_simulator,
+                                          MAX_FRAMES)
+        print(f"{filename}: full resolution {video_reports[filename]['full_ms']:.2f} ms")
+        for working_width, summary in video_reports[filename]['working_widths'].items():
+            print(f"    width {working_width:5}: agreement mean {summary['mean_agreement']:.4f}, "
+                  f"p5 {summary['p5_agreement']:.4f}, min {summary['min_agreement']:.4f}, "
+                  f"jaccard mean {summary['mean_jaccard']:.3f}, p5 {summary['p5_jaccard']:.3f}, "
+                  f"{summary['ms']:.2f} ms ({summary['speedup']:.1f}x)")
+
+    recommended = lowest_width(video_reports, OVERLAP_TARGET)
+    print(f"Lowest working width with an overlap of {OVERLAP_TARGET}: {recommended}")
+    with open(OUTPUT, 'w') as file:
+        json.dump({'target': OVERLAP_TARGET, 'recommended_width': recommended, 'videos': video_reports}, file)
+        file.close()